@@ -1,4 +1,5 @@
 import 'package:cloud_firestore/cloud_firestore.dart';
+import 'package:dio/dio.dart';
 
 import 'guest_model.dart';
 import 'mesa_model.dart';
@@ -6,6 +7,9 @@ import 'mesa_model.dart';
 /// Servicio de mesas
 class MesasService {
   final FirebaseFirestore _firestore = FirebaseFirestore.instance;
+  final Dio _dio = Dio();
+
+  static const String _backendBaseUrl = 'https://weddingapp-c6ix.onrender.com';
 
   Future<MesaModel?> getTableByNumber(String eventId, String tableNumber) async {
     final tableDoc = await _firestore
@@ -51,7 +55,26 @@ class MesasService {
     return GuestModel.fromFirestore(doc.id, doc.data());
   }
 
+  /// Búsqueda sin tildes vía el índice del backend; si falla, prefijo en Firestore.
   Future<List<GuestModel>> searchGuestsByName(String eventId, String queryText) async {
+    try {
+      final uri = Uri.parse(_backendBaseUrl).replace(
+        path: '/api/gallery/event/$eventId/guests/search',
+        queryParameters: {'q': queryText.trim(), 'limit': '20'},
+      );
+      final res = await _dio.get(uri.toString()).timeout(const Duration(seconds: 10));
+      final data = res.data as Map<String, dynamic>? ?? {};
+      return (data['items'] as List<dynamic>? ?? [])
+          .whereType<Map>()
+          .map((m) => GuestModel.fromFirestore(
+                (m['guestId'] ?? '').toString(),
+                Map<String, dynamic>.from(m),
+              ))
+          .toList();
+    } catch (_) {
+      // Respaldo: búsqueda por prefijo exacto (sensible a tildes).
+    }
+
     final queryLower = queryText.toLowerCase();
     final query = await _firestore
         .collection('events')
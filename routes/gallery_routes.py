@@ -6,19 +6,104 @@ Endpoints para gestión de fotos del evento:
 subir, listar, eliminar fotos.
 """
 
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, make_response
+import base64
+import click
+import hashlib
+import io
 import json
 import os
-import tempfile
 import uuid
-from datetime import datetime, timezone
-from urllib.parse import quote_plus
-from urllib.request import Request, urlopen
-
-from services.firebase_service import FirebaseService
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from urllib.parse import quote_plus, urlparse
+
+from firebase_admin import firestore
+from google.api_core.exceptions import AlreadyExists
+from google.cloud.firestore_v1.field_path import FieldPath
+
+from services.arrivals_stream import ArrivalsHub, arrival_from_doc
+from services.checkin_tokens import (
+    CHECKIN_REQUIRE_TOKEN,
+    CheckinTokenSigner,
+    InvalidCheckinToken,
+)
+from services.firebase_service import BATCH_LIMIT, FirebaseService
+from services.gallery_export import stream_zip
+from services.geocoding import GeocodingRateLimited, build_geocoding_gateway
+from services.guest_search import GuestSearchRegistry
+from services.image_variants import ImageVariantPipeline
+from services.sse import SSE_HEADERS, stream_queue, stream_slots
+from services.resumable_uploads import (
+    RECOMMENDED_CHUNK_BYTES,
+    OffsetMismatch,
+    ResumableUploadStore,
+    UploadIncomplete,
+    UploadSessionNotFound,
+)
+from services.ttl_cache import TTLCache
+from services.video_previews import VideoPreviewPipeline
+from services.upload_jobs import UploadJobQueue, UploadQueueFull
+from services.uploads import (
+    IMAGE_TYPES,
+    VIDEO_TYPES,
+    InvalidMultipart,
+    ProgressReader,
+    UploadTooLarge,
+    content_hash,
+    max_bytes_for,
+    media_type_for,
+    parse_capped_multipart,
+    stream_size,
+)
 
 gallery_bp = Blueprint('gallery', __name__)
 firebase_service = FirebaseService()
+upload_jobs = UploadJobQueue(firebase_service.db)
+image_variants = ImageVariantPipeline()
+geocoder = build_geocoding_gateway()
+checkin_tokens = CheckinTokenSigner()
+guest_search = GuestSearchRegistry(firebase_service.db)
+arrivals_hub = ArrivalsHub(firebase_service.db)
+cleanup_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix='gallery-cleanup')
+video_previews = VideoPreviewPipeline()
+resumable_uploads = ResumableUploadStore()
+
+# Límite de fotos por llamada al endpoint de engagement en lote.
+ENGAGEMENT_MAX_PHOTOS = 300
+ENGAGEMENT_WORKERS = 8
+
+# Orden y cursores por id de documento (la ruta especial '__name__').
+DOCUMENT_ID = FieldPath.document_id()
+
+# Paginación del feed: sin pageSize se mantiene el tamaño histórico (200).
+FEED_DEFAULT_PAGE_SIZE = 200
+FEED_MAX_PAGE_SIZE = 200
+
+# Comentarios por página (más recientes primero, devueltos en orden ascendente).
+COMMENTS_DEFAULT_LIMIT = 100
+COMMENTS_MAX_LIMIT = 200
+
+GUEST_SEARCH_DEFAULT_LIMIT = 10
+GUEST_SEARCH_MAX_LIMIT = 50
+ARRIVALS_SEARCH_LIMIT = 500
+
+# /arrivals?since: máximo por respuesta y solape para commits fuera de orden.
+ARRIVALS_SYNC_LIMIT = 500
+ARRIVALS_SYNC_OVERLAP_SECONDS = 5
+
+# Check-ins por request en /checkin/bulk (2 escrituras cada uno).
+BULK_CHECKIN_MAX_ITEMS = 1000
+
+# events/{eventId}/settings/public cacheado por proceso; los setters lo invalidan.
+PUBLIC_SETTINGS_TTL_SECONDS = 60
+public_settings_cache = TTLCache(ttl=PUBLIC_SETTINGS_TTL_SECONDS)
+
+# Reserva de gallery_hashes sin completar (proceso caído) que se puede retomar.
+HASH_RESERVATION_STALE_SECONDS = 15 * 60
+
+# Items guardados en el feed materializado events/{eventId}/gallery_feed/latest.
+FEED_SNAPSHOT_SIZE = 200
 
 
 def _expected_admin_code(event_id: str) -> str:
@@ -37,6 +122,69 @@ def _waze_url(latitude: float, longitude: float) -> str:
     return f'https://waze.com/ul?ll={latitude:.6f},{longitude:.6f}&navigate=yes'
 
 
+def _photo_doc(photo_id: str):
+    return firebase_service.db.collection('gallery').document(photo_id)
+
+
+def _count_docs(collection_ref) -> int:
+    # Agregación count(): se factura por bloques de índice, no por documento.
+    try:
+        result = collection_ref.count().get()
+        return int(result[0][0].value)
+    except Exception:
+        return sum(1 for _ in collection_ref.stream())
+
+
+def _stored_counter(photo_data: dict, field_name: str, collection_ref) -> int:
+    # Fotos antiguas no tienen contador: se calcula una vez desde la subcolección.
+    value = photo_data.get(field_name)
+    if value is None:
+        return _count_docs(collection_ref)
+    try:
+        return max(0, int(value))
+    except (TypeError, ValueError):
+        return _count_docs(collection_ref)
+
+
+@firestore.transactional
+def _toggle_like_txn(transaction, photo_ref, user_like_ref, name: str):
+    photo_snap = photo_ref.get(transaction=transaction)
+    if not photo_snap.exists:
+        return None, 0
+
+    like_snap = user_like_ref.get(transaction=transaction)
+    count = _stored_counter(photo_snap.to_dict() or {}, 'likeCount', photo_ref.collection('likes'))
+
+    if like_snap.exists:
+        # Ya tenía like -> eliminar (unlike)
+        transaction.delete(user_like_ref)
+        liked = False
+        count = max(0, count - 1)
+    else:
+        # No tenía like -> crear
+        transaction.set(user_like_ref, {
+            'name': name,
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+        })
+        liked = True
+        count += 1
+
+    transaction.update(photo_ref, {'likeCount': count})
+    return liked, count
+
+
+@firestore.transactional
+def _add_comment_txn(transaction, photo_ref, comment_ref, comment: dict):
+    photo_snap = photo_ref.get(transaction=transaction)
+    if not photo_snap.exists:
+        return None
+
+    count = _stored_counter(photo_snap.to_dict() or {}, 'commentCount', photo_ref.collection('comments'))
+    transaction.set(comment_ref, comment)
+    transaction.update(photo_ref, {'commentCount': count + 1})
+    return count + 1
+
+
 def _parse_coordinate(value, field_name: str) -> float:
     try:
         parsed = float(str(value).strip())
@@ -65,21 +213,339 @@ def upload_photo(event_id):
         return jsonify({'error': str(e)}), 400
 
 
+def _hash_doc(event_id: str, sha256: str):
+    return (
+        firebase_service.db
+        .collection('events')
+        .document(event_id)
+        .collection('gallery_hashes')
+        .document(sha256)
+    )
+
+
+def _hash_visible_to(entry: dict, user_id: str, visibility: str) -> bool:
+    # Solo se reutiliza si el viewer la puede ver igual que la suya: fotos
+    # públicas, o privadas del mismo usuario con la misma visibilidad.
+    return entry.get('visibility') == 'public' or (
+        entry.get('userId') == user_id and entry.get('visibility') == visibility
+    )
+
+
+def _reserve_content_hash(event_id: str, sha256: str, user_id: str, visibility: str):
+    """
+    Reserva events/{eventId}/gallery_hashes/{sha256} antes de subir. create()
+    falla si ya existe, así dos subidas iguales a la vez no suben dos copias.
+
+    Returns:
+        (reserved, existing):
+          (True, None)       esta subida es dueña de la entrada (pending);
+                             _store_gallery_media la completa o la libera
+          (False, dict)      subida idéntica visible para este usuario
+                             (respuesta con "duplicate": true)
+          (False, pending)   la misma subida está en curso (existing['pending'])
+          (False, None)      hay una copia que este usuario no ve: se sube
+                             sin tocar el índice
+    """
+    ref = _hash_doc(event_id, sha256)
+    reservation = {
+        'pending': True,
+        'userId': user_id,
+        'visibility': visibility,
+        'reservedAt': datetime.now(timezone.utc).isoformat(),
+    }
+    try:
+        ref.create(reservation)
+        return True, None
+    except AlreadyExists:
+        pass
+
+    snap = ref.get()
+    if not snap.exists:
+        # Se liberó entre el create y la lectura: un intento más.
+        try:
+            ref.create(reservation)
+            return True, None
+        except AlreadyExists:
+            return False, {'pending': True}
+
+    entry = snap.to_dict() or {}
+    if not _hash_visible_to(entry, user_id, visibility):
+        return False, None
+    if entry.get('pending'):
+        reserved_at = datetime.fromisoformat(entry.get('reservedAt') or reservation['reservedAt'])
+        if (datetime.now(timezone.utc) - reserved_at).total_seconds() > HASH_RESERVATION_STALE_SECONDS:
+            ref.set(reservation)
+            return True, None
+        return False, {'pending': True}
+    return False, {
+        'photoId': entry.get('photoId', ''),
+        'imageUrl': entry.get('mediaUrl', ''),
+        'mediaUrl': entry.get('mediaUrl', ''),
+        'mediaType': entry.get('mediaType', 'image'),
+        'duplicate': True,
+    }
+
+
+def _release_content_hash(event_id: str, sha256: str) -> None:
+    """Borra la reserva si la subida no llegó a completarla."""
+    try:
+        ref = _hash_doc(event_id, sha256)
+        snap = ref.get()
+        if snap.exists and (snap.to_dict() or {}).get('pending'):
+            ref.delete()
+    except Exception as e:
+        print('Error liberando reserva de hash:', e)
+
+
+def _store_gallery_media(file_obj, size: int, mimetype: str, file_ext: str,
+                         event_id: str, user_id: str, user_name: str, visibility: str,
+                         sha256: str = '', hash_reserved: bool = False) -> dict:
+    """
+    Sube el archivo a Storage, crea gallery/{photoId} y lo publica en el feed.
+
+    Con `hash_reserved` (ver _reserve_content_hash) completa la entrada de
+    gallery_hashes, o la libera si la subida falla.
+    """
+    media_type = media_type_for(mimetype)
+    media_id = str(uuid.uuid4())
+    destination_path = f'gallery/{event_id}/{user_id}/{media_id}{file_ext}'
+
+    try:
+        media_url = firebase_service.upload_fileobj(
+            file_obj,
+            destination_path,
+            content_type=mimetype,
+            resource_type=media_type,
+            size=size,
+        )
+
+        doc_data = {
+            'imageUrl': media_url,
+            'mediaUrl': media_url,
+            'mediaType': media_type,
+            'userId': user_id,
+            'userName': user_name,
+            'visibility': visibility,
+            'eventId': event_id,
+            'createdAt': datetime.now(timezone.utc).isoformat(),
+            'likeCount': 0,
+            'commentCount': 0,
+            'contentHash': sha256,
+            'storagePath': destination_path,
+        }
+
+        photo_id = firebase_service.create_document('gallery', doc_data)
+    except Exception:
+        if hash_reserved:
+            _release_content_hash(event_id, sha256)
+        raise
+
+    _feed_publish(event_id, _feed_item(photo_id, doc_data))
+
+    if hash_reserved:
+        _hash_doc(event_id, sha256).set({
+            'photoId': photo_id,
+            'mediaUrl': media_url,
+            'mediaType': media_type,
+            'userId': user_id,
+            'visibility': visibility,
+            'createdAt': doc_data['createdAt'],
+        })
+
+    file_obj.seek(0)
+    if media_type == 'image':
+        _schedule_image_variants(photo_id, doc_data, destination_path, file_obj.read())
+    else:
+        _schedule_video_previews(photo_id, doc_data, destination_path, file_ext, file_obj)
+
+    return {
+        'photoId': photo_id,
+        'imageUrl': media_url,
+        'mediaUrl': media_url,
+        'mediaType': media_type,
+    }
+
+
+def _schedule_image_variants(photo_id: str, doc_data: dict, destination_path: str, data: bytes) -> None:
+    """
+    Genera thumb/medium/full en segundo plano y los guarda en gallery/{photoId}:
+      variants: { thumb|medium|full: { url, width, height } }
+      thumbnailUrl, mediumUrl
+    """
+    base_path = os.path.splitext(destination_path)[0]
+
+    def on_ready(variants):
+        stored = {}
+        for variant in variants:
+            path = f"{base_path}_{variant['name']}{variant['ext']}"
+            url = firebase_service.upload_fileobj(
+                io.BytesIO(variant['data']),
+                path,
+                content_type=variant['contentType'],
+                resource_type='image',
+                size=len(variant['data']),
+            )
+            stored[variant['name']] = {
+                'url': url,
+                'path': path,
+                'width': variant['width'],
+                'height': variant['height'],
+            }
+
+        updates = {
+            'variants': stored,
+            'thumbnailUrl': stored.get('thumb', {}).get('url', ''),
+            'mediumUrl': stored.get('medium', {}).get('url', ''),
+        }
+        if not _attach_derivatives(photo_id, updates):
+            return
+        _feed_publish(doc_data['eventId'], _feed_item(photo_id, {**doc_data, **updates}))
+
+    image_variants.submit(data, on_ready)
+
+
+def _schedule_video_previews(photo_id: str, doc_data: dict, destination_path: str,
+                             file_ext: str, file_obj) -> None:
+    """
+    Extrae poster y clip corto en segundo plano y los guarda en gallery/{photoId}:
+      posterUrl (también como thumbnailUrl), previewUrl,
+      durationSeconds, width, height
+    """
+    base_path = os.path.splitext(destination_path)[0]
+
+    def on_ready(result):
+        poster_path = f'{base_path}_poster.jpg'
+        preview_path = f'{base_path}_preview.mp4'
+        poster_url = firebase_service.upload_fileobj(
+            io.BytesIO(result['poster']),
+            poster_path,
+            content_type='image/jpeg',
+            resource_type='image',
+            size=len(result['poster']),
+        )
+        preview_url = firebase_service.upload_fileobj(
+            io.BytesIO(result['preview']),
+            preview_path,
+            content_type='video/mp4',
+            resource_type='video',
+            size=len(result['preview']),
+        )
+
+        updates = {
+            'posterUrl': poster_url,
+            'posterPath': poster_path,
+            'thumbnailUrl': poster_url,
+            'previewUrl': preview_url,
+            'previewPath': preview_path,
+            'durationSeconds': result['durationSeconds'],
+            'width': result['width'],
+            'height': result['height'],
+        }
+        if not _attach_derivatives(photo_id, updates):
+            return
+        _feed_publish(doc_data['eventId'], _feed_item(photo_id, {**doc_data, **updates}))
+
+    video_previews.submit(file_obj, file_ext, on_ready)
+
+
+def _attach_derivatives(photo_id: str, updates: dict) -> bool:
+    """Guarda variantes/previews en la foto; si ya fue borrada, borra los archivos."""
+    try:
+        firebase_service.update_document('gallery', photo_id, updates)
+        return True
+    except Exception:
+        if firebase_service.get_document('gallery', photo_id) is not None:
+            raise
+        _delete_storage_objects(_storage_objects(updates))
+        return False
+
+
+def _storage_objects(data: dict) -> list:
+    """(ruta, resource_type) de todos los archivos en Storage de una foto."""
+    media_type = data.get('mediaType') or 'image'
+    objects = []
+
+    original = data.get('storagePath') or firebase_service.storage_path_from_url(
+        data.get('mediaUrl') or data.get('imageUrl')
+    )
+    if original:
+        objects.append((original, media_type))
+
+    for variant in (data.get('variants') or {}).values():
+        if isinstance(variant, dict) and variant.get('path'):
+            objects.append((variant['path'], 'image'))
+    if data.get('posterPath'):
+        objects.append((data['posterPath'], 'image'))
+    if data.get('previewPath'):
+        objects.append((data['previewPath'], 'video'))
+    return objects
+
+
+def _delete_storage_objects(objects: list) -> None:
+    for path, resource_type in objects:
+        try:
+            firebase_service.delete_file(path, resource_type=resource_type)
+        except Exception as e:
+            print(f'Error borrando {path} de Storage:', e)
+
+
+def _purge_photo(photo_id: str, data: dict) -> None:
+    """Limpieza en segundo plano: archivos en Storage, likes y comentarios."""
+    try:
+        _delete_storage_objects(_storage_objects(data))
+        photo_ref = _photo_doc(photo_id)
+        firebase_service.delete_collection(photo_ref.collection('likes'))
+        firebase_service.delete_collection(photo_ref.collection('comments'))
+    except Exception as e:
+        print(f'Error limpiando foto {photo_id}:', e)
+
+
+def _forget_content_hash(event_id: str, sha256: str, photo_id: str) -> None:
+    # Solo si el índice apunta a esta foto (otra copia pudo reemplazarla).
+    if not sha256:
+        return
+    ref = _hash_doc(event_id, sha256)
+    snap = ref.get()
+    if snap.exists and (snap.to_dict() or {}).get('photoId') == photo_id:
+        ref.delete()
+
+
 @gallery_bp.route('/upload', methods=['POST'])
 def upload_gallery_image():
+    """
+    Sube una foto o video a la galería (multipart/form-data).
+
+    Form:
+      file, eventId, userId, userName (opcional), visibility (public | novios)
 
+    Query:
+      - async=1 (opcional): encola la subida y responde 202 con jobId;
+        el estado se consulta en GET /upload-jobs/<jobId>.
+
+    Si el mismo archivo (SHA-256) ya está en el evento responde 200 con la
+    foto existente y "duplicate": true, sin subir nada.
+    """
     try:
 
-        if 'file' not in request.files:
+        # Parseo propio: rechaza por tamaño sin escribir nada a disco.
+        try:
+            form, files = parse_capped_multipart(request)
+        except UploadTooLarge as exc:
+            return jsonify({'error': str(exc)}), 413
+        except InvalidMultipart as exc:
+            return jsonify({'error': str(exc)}), 400
+
+        if 'file' not in files:
             return jsonify({'error': 'Archivo requerido (file)'}), 400
 
-        file = request.files['file']
-        event_id = request.form.get('eventId')
-        user_id = request.form.get('userId')
-        user_name = (request.form.get('userName') or '').strip() or 'Invitado'
-        visibility = (request.form.get('visibility') or '').strip().lower() or 'public'
+        file = files['file']
+        event_id = form.get('eventId')
+        user_id = form.get('userId')
+        user_name = (form.get('userName') or '').strip() or 'Invitado'
+        visibility = (form.get('visibility') or '').strip().lower() or 'public'
         if visibility not in {'public', 'novios'}:
             visibility = 'public'
+        run_async = (request.args.get('async') or '').strip().lower() in {'1', 'true', 'yes'}
 
         if not event_id or not user_id:
             return jsonify({'error': 'eventId y userId son requeridos'}), 400
@@ -87,77 +553,366 @@ def upload_gallery_image():
         if not file.filename:
             return jsonify({'error': 'Nombre de archivo inválido'}), 400
 
-        image_types = {'image/jpeg', 'image/jpg', 'image/png', 'image/webp'}
-        video_types = {'video/mp4', 'video/quicktime', 'video/webm'}
-        allowed_types = image_types | video_types
-        if file.mimetype not in allowed_types:
+        if file.mimetype not in IMAGE_TYPES | VIDEO_TYPES:
             return jsonify({'error': 'Tipo de archivo inválido. Usa imagen o video MP4/MOV/WEBM'}), 400
 
-        media_type = 'video' if file.mimetype in video_types else 'image'
-        max_size_bytes = (40 if media_type == 'video' else 10) * 1024 * 1024
-
         file_ext = os.path.splitext(file.filename or '')[1].lower() or '.jpg'
-        media_id = str(uuid.uuid4())
-        destination_path = f'gallery/{event_id}/{user_id}/{media_id}{file_ext}'
+        size = stream_size(file.stream)
+        mimetype = file.mimetype
+        sha256 = content_hash(file.stream)
+
+        # Misma foto ya subida al evento (reintentos, reenvíos): no se sube de nuevo.
+        hash_reserved, existing = _reserve_content_hash(event_id, sha256, user_id, visibility)
+        if existing and existing.get('pending'):
+            return jsonify({'error': 'Este archivo ya se está subiendo, intenta de nuevo en unos segundos'}), 409
+        if existing:
+            return jsonify(existing), 200
+
+        if not run_async:
+            result = _store_gallery_media(
+                file.stream, size, mimetype, file_ext,
+                event_id, user_id, user_name, visibility, sha256, hash_reserved,
+            )
+            return jsonify(result), 201
 
-        with tempfile.NamedTemporaryFile(delete=False) as temp_file:
-            file.save(temp_file.name)
-            temp_path = temp_file.name
+        # La cola copia el archivo a disco; el buffer en memoria se libera aquí.
+        def work(spooled, report_progress):
+            return _store_gallery_media(
+                ProgressReader(spooled, size, report_progress), size, mimetype, file_ext,
+                event_id, user_id, user_name, visibility, sha256, hash_reserved,
+            )
 
         try:
-            file_size = os.path.getsize(temp_path)
-            if file_size > max_size_bytes:
-                limit_mb = int(max_size_bytes / (1024 * 1024))
-                return jsonify({'error': f'Archivo demasiado grande. Máximo {limit_mb}MB'}), 400
-
-            media_url = firebase_service.upload_file(
-                temp_path,
-                destination_path,
-                content_type=file.mimetype,
-                resource_type=media_type,
-            )
+            job_id = upload_jobs.submit(work, {
+                'eventId': event_id,
+                'userId': user_id,
+                'mediaType': media_type_for(mimetype),
+                'size': size,
+            }, file.stream, size)
+        except Exception as exc:
+            if hash_reserved:
+                _release_content_hash(event_id, sha256)
+            if isinstance(exc, UploadQueueFull):
+                return jsonify({'error': str(exc)}), 503
+            raise
         finally:
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
+            file.stream.close()
 
-        doc_data = {
-            'imageUrl': media_url,
-            'mediaUrl': media_url,
-            'mediaType': media_type,
+        return jsonify({'jobId': job_id, 'status': 'queued'}), 202
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+
+
+# ------------------------------
+# SUBIDA REANUDABLE POR CHUNKS
+# ------------------------------
+
+@gallery_bp.route('/uploads', methods=['POST'])
+def init_resumable_upload():
+    """
+    Inicia una subida reanudable.
+
+    Body JSON:
+    {
+      "eventId": "...", "userId": "...", "userName": "...",
+      "visibility": "public" | "novios",
+      "filename": "video.mp4", "mimeType": "video/mp4", "size": <bytes>
+    }
+
+    Respuesta:
+      { "uploadId": "...", "offset": 0, "chunkSize": <bytes sugeridos> }
+    """
+    data = request.get_json(silent=True) or {}
+    event_id = (data.get('eventId') or '').strip()
+    user_id = (data.get('userId') or '').strip()
+    user_name = (data.get('userName') or '').strip() or 'Invitado'
+    filename = (data.get('filename') or '').strip()
+    mimetype = (data.get('mimeType') or '').strip().lower()
+    visibility = (data.get('visibility') or '').strip().lower() or 'public'
+    if visibility not in {'public', 'novios'}:
+        visibility = 'public'
+
+    if not event_id or not user_id:
+        return jsonify({'error': 'eventId y userId son requeridos'}), 400
+    if not filename:
+        return jsonify({'error': 'Nombre de archivo inválido'}), 400
+    if mimetype not in IMAGE_TYPES | VIDEO_TYPES:
+        return jsonify({'error': 'Tipo de archivo inválido. Usa imagen o video MP4/MOV/WEBM'}), 400
+
+    try:
+        size = int(data.get('size'))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'size requerido'}), 400
+    max_bytes = max_bytes_for(mimetype)
+    if size <= 0:
+        return jsonify({'error': 'size inválido'}), 400
+    if size > max_bytes:
+        return jsonify({'error': str(UploadTooLarge(max_bytes))}), 413
+
+    try:
+        upload_id = resumable_uploads.create({
+            'eventId': event_id,
             'userId': user_id,
             'userName': user_name,
             'visibility': visibility,
-            'eventId': event_id,
+            'filename': filename,
+            'mimeType': mimetype,
+            'size': size,
+            'maxBytes': max_bytes,
             'createdAt': datetime.now(timezone.utc).isoformat(),
-        }
-
-        photo_id = firebase_service.create_document('gallery', doc_data)
-
+        })
         return jsonify({
-            'photoId': photo_id,
-            'imageUrl': media_url,
-            'mediaUrl': media_url,
-            'mediaType': media_type,
+            'uploadId': upload_id,
+            'offset': 0,
+            'chunkSize': RECOMMENDED_CHUNK_BYTES,
         }), 201
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@gallery_bp.route('/uploads/<upload_id>', methods=['GET'])
+def get_resumable_upload(upload_id):
+    """Bytes ya recibidos, para retomar tras un corte: { "offset", "size" }."""
+    try:
+        meta = resumable_uploads.get(upload_id)
+        return jsonify({'uploadId': upload_id, 'offset': meta['offset'], 'size': meta['size']}), 200
+    except UploadSessionNotFound as exc:
+        return jsonify({'error': str(exc)}), 404
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@gallery_bp.route('/uploads/<upload_id>', methods=['PUT'])
+def put_resumable_chunk(upload_id):
+    """
+    Agrega un chunk (cuerpo binario crudo) a la subida.
+
+    Query:
+      - offset: byte en el que empieza este chunk
+
+    Si el offset no coincide responde 409 con el offset correcto.
+
+    Respuesta:
+      { "offset": <bytes recibidos>, "size": <total>, "complete": <bool> }
+    """
+    try:
+        offset = int(request.args.get('offset'))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'offset requerido'}), 400
+
+    try:
+        new_offset = resumable_uploads.append(upload_id, offset, request.stream)
+        size = resumable_uploads.get(upload_id)['size']
+        return jsonify({'offset': new_offset, 'size': size, 'complete': new_offset == size}), 200
+    except OffsetMismatch as exc:
+        return jsonify({'error': str(exc), 'offset': exc.offset}), 409
+    except UploadSessionNotFound as exc:
+        return jsonify({'error': str(exc)}), 404
+    except UploadTooLarge as exc:
+        return jsonify({'error': str(exc)}), 413
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+
+
+@gallery_bp.route('/uploads/<upload_id>/finalize', methods=['POST'])
+def finalize_resumable_upload(upload_id):
+    """
+    Cierra la subida: sube el archivo a Storage y crea gallery/{photoId}.
+
+    Query:
+      - async=1 (opcional): igual que en /upload, responde 202 con jobId.
+
+    Respuesta: la misma de POST /upload. Repetir finalize devuelve el mismo
+    resultado (o el mismo jobId) sin volver a subir; si otro request lo está
+    finalizando sin job responde 409 y el cliente reintenta.
+    """
+    run_async = (request.args.get('async') or '').strip().lower() in {'1', 'true', 'yes'}
+
+    try:
+        meta, started = resumable_uploads.begin_finalize(upload_id)
+    except UploadSessionNotFound as exc:
+        return jsonify({'error': str(exc)}), 404
+    except UploadIncomplete as exc:
+        return jsonify({'error': str(exc), 'offset': exc.offset}), 409
+
+    if not started:
+        if meta.get('state') == 'done':
+            return jsonify(meta['result']), meta.get('resultStatus', 201)
+        if meta.get('jobId'):
+            return jsonify({'jobId': meta['jobId'], 'status': 'queued'}), 202
+        return jsonify({'error': 'La subida se está finalizando', 'status': 'finalizing'}), 409
+
+    try:
+        path = resumable_uploads.data_path(upload_id)
+        file_ext = os.path.splitext(meta['filename'])[1].lower() or '.jpg'
+        args = (meta['mimeType'], file_ext, meta['eventId'], meta['userId'], meta['userName'], meta['visibility'])
+
+        with open(path, 'rb') as fh:
+            sha256 = content_hash(fh)
+
+        hash_reserved, existing = _reserve_content_hash(meta['eventId'], sha256, meta['userId'], meta['visibility'])
+        if existing and existing.get('pending'):
+            resumable_uploads.release(upload_id)
+            return jsonify({'error': 'Este archivo ya se está subiendo, intenta de nuevo en unos segundos'}), 409
+        if existing:
+            resumable_uploads.finish(upload_id, existing, 200)
+            return jsonify(existing), 200
+
+        def work(source, report_progress=None):
+            # Si falla, la sesión vuelve a aceptar finalize (expira sola).
+            try:
+                if report_progress:
+                    source = ProgressReader(source, meta['size'], report_progress)
+                result = _store_gallery_media(source, meta['size'], *args, sha256, hash_reserved)
+            except Exception:
+                resumable_uploads.release(upload_id)
+                raise
+            resumable_uploads.finish(upload_id, result, 201)
+            return result
+
+        if not run_async:
+            with open(path, 'rb') as fh:
+                return jsonify(work(fh)), 201
+
+        try:
+            with open(path, 'rb') as fh:
+                job_id = upload_jobs.submit(work, {
+                    'eventId': meta['eventId'],
+                    'userId': meta['userId'],
+                    'mediaType': media_type_for(meta['mimeType']),
+                    'size': meta['size'],
+                }, fh, meta['size'])
+        except Exception as exc:
+            if hash_reserved:
+                _release_content_hash(meta['eventId'], sha256)
+            if isinstance(exc, UploadQueueFull):
+                resumable_uploads.release(upload_id)
+                return jsonify({'error': str(exc)}), 503
+            raise
+
+        resumable_uploads.set_job(upload_id, job_id)
+        return jsonify({'jobId': job_id, 'status': 'queued'}), 202
 
     except Exception as e:
+        resumable_uploads.release(upload_id)
         return jsonify({'error': str(e)}), 400
 
 
+@gallery_bp.route('/upload-jobs/<job_id>', methods=['GET'])
+def get_upload_job(job_id):
+    """
+    Estado de una subida asíncrona.
+
+    Respuesta:
+    {
+      "jobId": "...",
+      "status": "queued" | "uploading" | "done" | "error",
+      "progress": 0.0-1.0,
+      "photoId", "mediaUrl", ... (cuando status == done)
+      "error": "..." (cuando status == error)
+    }
+    """
+    try:
+        job = upload_jobs.get(job_id)
+        if job is None:
+            return jsonify({'error': 'Job no encontrado'}), 404
+        return jsonify(job), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
 @gallery_bp.route('/photos/<photo_id>', methods=['DELETE'])
 def delete_photo(photo_id):
+    """
+    Elimina una foto.
 
+    El doc gallery/{photoId} y su entrada en el feed se borran en el
+    request; los archivos en Storage y las subcolecciones likes/comments
+    se limpian en segundo plano.
+    """
     try:
         if not photo_id:
             return jsonify({'error': 'photoId requerido'}), 400
 
-        # Eliminar metadata del documento (para demo es suficiente).
+        photo_data = firebase_service.get_document('gallery', photo_id)
+        if photo_data is None:
+            return jsonify({'ok': True}), 200
+
         firebase_service.delete_document('gallery', photo_id)
+        # Ya sin doc, un reintento respondería ok: la limpieza se encola aquí.
+        cleanup_pool.submit(_purge_photo, photo_id, photo_data)
+
+        event_id = (photo_data.get('eventId') or '').strip()
+        if event_id:
+            _feed_unpublish(event_id, photo_id)
+            try:
+                _forget_content_hash(event_id, photo_data.get('contentHash'), photo_id)
+            except Exception as e:
+                print(f'Error limpiando hash de {photo_id}:', e)
+
         return jsonify({'ok': True}), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 400
 
 
+def _purge_user_uploads(event_id: str, docs: list) -> None:
+    # Docs en lotes de 500; luego un solo rebuild del feed en vez de uno por foto.
+    try:
+        for start in range(0, len(docs), BATCH_LIMIT):
+            batch = firebase_service.db.batch()
+            for doc in docs[start:start + BATCH_LIMIT]:
+                batch.delete(doc.reference)
+            batch.commit()
+        _rebuild_feed_snapshot(event_id)
+    except Exception as e:
+        print('Error borrando subidas del usuario:', e)
+        _feed_invalidate(event_id)
+        return
+
+    for doc in docs:
+        data = doc.to_dict() or {}
+        try:
+            _forget_content_hash(event_id, data.get('contentHash'), doc.id)
+        except Exception as e:
+            print(f'Error limpiando hash de {doc.id}:', e)
+        _purge_photo(doc.id, data)
+
+
+@gallery_bp.route('/event/<event_id>/users/<user_id>/photos', methods=['DELETE'])
+def delete_user_uploads(event_id, user_id):
+    """
+    Moderación: elimina todas las fotos/videos de un usuario en el evento
+    (solo novios).
+
+    adminCode va en el body JSON o en la query.
+
+    Responde 202 con la cantidad encontrada; el borrado (docs, feed,
+    Storage, likes y comentarios) corre en segundo plano.
+    """
+    data = request.get_json(silent=True) or {}
+    admin_code = (data.get('adminCode') or request.args.get('adminCode') or '').strip().upper()
+
+    if not event_id or not user_id:
+        return jsonify({'error': 'eventId y userId son requeridos'}), 400
+    if admin_code != _expected_admin_code(event_id):
+        return jsonify({'error': 'Código de novios inválido'}), 403
+
+    try:
+        docs = list(
+            firebase_service.db
+            .collection('gallery')
+            .where('eventId', '==', event_id)
+            .where('userId', '==', user_id)
+            .stream()
+        )
+        if docs:
+            cleanup_pool.submit(_purge_user_uploads, event_id, docs)
+        return jsonify({'ok': True, 'count': len(docs)}), 202
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
 @gallery_bp.route('/photos/<photo_id>/likes/toggle', methods=['POST'])
 def toggle_photo_like(photo_id):
     """
@@ -167,6 +922,9 @@ def toggle_photo_like(photo_id):
       gallery/{photoId}/likes/{userId}
     para evitar depender del estado offline del SDK web.
 
+    En la misma transacción actualiza el contador desnormalizado
+    gallery/{photoId}.likeCount, así no hay que recontar la subcolección.
+
     Body JSON esperado:
     {
       "userId": "...",
@@ -181,30 +939,17 @@ def toggle_photo_like(photo_id):
         return jsonify({'error': 'userId requerido'}), 400
 
     try:
-        likes_ref = (
-            firebase_service.db
-            .collection('gallery')
-            .document(photo_id)
-            .collection('likes')
+        photo_ref = _photo_doc(photo_id)
+        user_like_ref = photo_ref.collection('likes').document(user_id)
+
+        liked, count = _toggle_like_txn(
+            firebase_service.db.transaction(),
+            photo_ref,
+            user_like_ref,
+            name,
         )
-
-        user_like_ref = likes_ref.document(user_id)
-        snap = user_like_ref.get()
-
-        if snap.exists:
-            # Ya tenía like -> eliminar (unlike)
-            user_like_ref.delete()
-            liked = False
-        else:
-            # No tenía like -> crear
-            user_like_ref.set({
-                'name': name,
-                'timestamp': datetime.now(timezone.utc).isoformat(),
-            })
-            liked = True
-
-        # Recontar likes actuales
-        count = sum(1 for _ in likes_ref.stream())
+        if liked is None:
+            return jsonify({'error': 'Foto no encontrada'}), 404
 
         return jsonify({
             'liked': liked,
@@ -215,55 +960,332 @@ def toggle_photo_like(photo_id):
         return jsonify({'error': str(e)}), 400
 
 
+def _encode_feed_cursor(created_at: str, doc_id: str) -> str:
+    raw = json.dumps([created_at, doc_id], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def _decode_feed_cursor(cursor: str):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, doc_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except Exception as exc:
+        raise ValueError('cursor inválido') from exc
+    if not isinstance(created_at, str) or not isinstance(doc_id, str) or not doc_id or '/' in doc_id:
+        raise ValueError('cursor inválido')
+    return created_at, doc_id
+
+
+def _feed_item(doc_id: str, data: dict) -> dict:
+    created_at = data.get('createdAt')
+    if hasattr(created_at, 'isoformat'):
+        created_at = created_at.isoformat()
+
+    return {
+        'photoId': doc_id,
+        'imageUrl': data.get('imageUrl', ''),
+        'mediaUrl': data.get('mediaUrl', data.get('imageUrl', '')),
+        'mediaType': data.get('mediaType', 'image'),
+        'thumbnailUrl': data.get('thumbnailUrl', ''),
+        'mediumUrl': data.get('mediumUrl', ''),
+        'posterUrl': data.get('posterUrl', ''),
+        'previewUrl': data.get('previewUrl', ''),
+        'durationSeconds': data.get('durationSeconds'),
+        'width': data.get('width'),
+        'height': data.get('height'),
+        'eventId': data.get('eventId', ''),
+        'userId': data.get('userId', ''),
+        'userName': data.get('userName', ''),
+        'visibility': (data.get('visibility') or 'public').strip().lower(),
+        'createdAt': created_at,
+    }
+
+
+def _feed_page(query, page_size: int, cursor):
+    """
+    Una página de `query` ordenada por (createdAt, id) descendente.
+
+    Requiere los índices compuestos de app/firestore.indexes.json.
+    """
+    query = (
+        query
+        .order_by('createdAt', direction=firestore.Query.DESCENDING)
+        .order_by(DOCUMENT_ID, direction=firestore.Query.DESCENDING)
+    )
+    if cursor:
+        created_at, doc_id = cursor
+        query = query.start_after({
+            'createdAt': created_at,
+            DOCUMENT_ID: _photo_doc(doc_id),
+        })
+    return list(query.limit(page_size).stream())
+
+
+def _feed_doc(event_id: str):
+    return (
+        firebase_service.db
+        .collection('events')
+        .document(event_id)
+        .collection('gallery_feed')
+        .document('latest')
+    )
+
+
+def _feed_sort_key(item: dict):
+    return (item.get('createdAt') or '', item.get('photoId') or '')
+
+
+def _rebuild_feed_snapshot(event_id: str) -> dict:
+    base = firebase_service.db.collection('gallery').where('eventId', '==', event_id)
+    docs = _feed_page(base, FEED_SNAPSHOT_SIZE + 1, None)
+    payload = {
+        'items': [_feed_item(doc.id, doc.to_dict() or {}) for doc in docs[:FEED_SNAPSHOT_SIZE]],
+        'truncated': len(docs) > FEED_SNAPSHOT_SIZE,
+        'updatedAt': datetime.now(timezone.utc).isoformat(),
+    }
+    _feed_doc(event_id).set(payload)
+    return payload
+
+
+@firestore.transactional
+def _feed_push_txn(transaction, feed_ref, item: dict) -> bool:
+    snap = feed_ref.get(transaction=transaction)
+    if not snap.exists:
+        return False
+
+    data = snap.to_dict() or {}
+    items = [i for i in (data.get('items') or []) if i.get('photoId') != item['photoId']]
+    items.append(item)
+    items.sort(key=_feed_sort_key, reverse=True)
+
+    transaction.set(feed_ref, {
+        'items': items[:FEED_SNAPSHOT_SIZE],
+        'truncated': bool(data.get('truncated')) or len(items) > FEED_SNAPSHOT_SIZE,
+        'updatedAt': datetime.now(timezone.utc).isoformat(),
+    })
+    return True
+
+
+@firestore.transactional
+def _feed_remove_txn(transaction, feed_ref, photo_id: str) -> bool:
+    """Quita la foto del feed. Devuelve True si hay que reconstruirlo para rellenar."""
+    snap = feed_ref.get(transaction=transaction)
+    if not snap.exists:
+        return False
+
+    data = snap.to_dict() or {}
+    current = data.get('items') or []
+    items = [i for i in current if i.get('photoId') != photo_id]
+    if len(items) == len(current):
+        return False
+    if data.get('truncated'):
+        return True
+
+    transaction.set(feed_ref, {
+        'items': items,
+        'truncated': False,
+        'updatedAt': datetime.now(timezone.utc).isoformat(),
+    })
+    return False
+
+
+def _feed_publish(event_id: str, item: dict) -> None:
+    try:
+        if not _feed_push_txn(firebase_service.db.transaction(), _feed_doc(event_id), item):
+            _rebuild_feed_snapshot(event_id)
+    except Exception as e:
+        print('Error actualizando feed materializado:', e)
+        _feed_invalidate(event_id)
+
+
+def _feed_unpublish(event_id: str, photo_id: str) -> None:
+    try:
+        if _feed_remove_txn(firebase_service.db.transaction(), _feed_doc(event_id), photo_id):
+            _rebuild_feed_snapshot(event_id)
+    except Exception as e:
+        print('Error actualizando feed materializado:', e)
+        _feed_invalidate(event_id)
+
+
+def _feed_invalidate(event_id: str) -> None:
+    # Sin snapshot, la siguiente lectura lo reconstruye desde la colección.
+    try:
+        _feed_doc(event_id).delete()
+    except Exception as e:
+        print('Error invalidando feed materializado:', e)
+
+
+def _visible_to(item: dict, include_private: bool, viewer_id: str) -> bool:
+    if include_private or item.get('visibility') != 'novios':
+        return True
+    return bool(viewer_id) and viewer_id == (item.get('userId') or '')
+
+
+def _conditional_json(payload: dict, cache_control: str = 'no-cache'):
+    """Respuesta JSON con ETag fuerte; si coincide con If-None-Match devuelve 304."""
+    body = json.dumps(payload, sort_keys=True, separators=(',', ':'))
+    response = make_response(jsonify(payload), 200)
+    response.set_etag(hashlib.sha256(body.encode('utf-8')).hexdigest())
+    response.headers['Cache-Control'] = cache_control
+    return response.make_conditional(request)
+
+
 @gallery_bp.route('/event/<event_id>', methods=['GET'])
 def get_event_photos(event_id):
+    """
+    Feed paginado de fotos/videos del evento (más recientes primero).
+
+    Query params:
+      - pageSize (opcional): tamaño de página, máx. 200
+      - cursor (opcional): nextCursor devuelto por la página anterior
+      - viewerId (opcional): ve también sus propias fotos privadas
+      - includePrivate (opcional): incluye fotos "novios" de todos
 
+    La primera página se sirve desde el feed materializado
+    events/{eventId}/gallery_feed/latest (1 lectura), que mantienen
+    upload_gallery_image y delete_photo. Las páginas siguientes filtran la
+    visibilidad en Firestore: sin includePrivate se combinan las públicas
+    con las privadas del propio viewer, ambas con el mismo cursor, así cada
+    página cuesta como máximo 2 * pageSize lecturas.
+
+    Responde con ETag fuerte: si el cliente manda If-None-Match y el feed
+    no cambió, la respuesta es 304 sin cuerpo.
+
+    Respuesta:
+      { "items": [...], "nextCursor": "..." | null }
+    """
     if not event_id:
         return jsonify({'error': 'eventId requerido'}), 400
 
     include_private = (request.args.get('includePrivate') or '').strip().lower() in {'1', 'true', 'yes'}
     viewer_id = (request.args.get('viewerId') or '').strip()
+    cursor_raw = (request.args.get('cursor') or '').strip()
+
+    try:
+        page_size = int(request.args.get('pageSize') or FEED_DEFAULT_PAGE_SIZE)
+    except ValueError:
+        page_size = FEED_DEFAULT_PAGE_SIZE
+    page_size = max(1, min(page_size, FEED_MAX_PAGE_SIZE))
+
+    try:
+        cursor = _decode_feed_cursor(cursor_raw) if cursor_raw else None
+    except ValueError as exc:
+        return jsonify({'error': str(exc)}), 400
+
+    try:
+        if cursor is None and page_size <= FEED_SNAPSHOT_SIZE:
+            snap = _feed_doc(event_id).get()
+            feed = snap.to_dict() if snap.exists else _rebuild_feed_snapshot(event_id)
+            feed = feed or {}
+            visible = [
+                item for item in (feed.get('items') or [])
+                if _visible_to(item, include_private, viewer_id)
+            ]
+            # Si el snapshot no alcanza a llenar la página y hay más fotos, se consulta.
+            if len(visible) >= page_size or not feed.get('truncated'):
+                items = visible[:page_size]
+                next_cursor = None
+                if len(items) == page_size:
+                    last = items[-1]
+                    next_cursor = _encode_feed_cursor(last.get('createdAt') or '', last.get('photoId') or '')
+                return _conditional_json({'items': items, 'nextCursor': next_cursor})
+
+        base = firebase_service.db.collection('gallery').where('eventId', '==', event_id)
+
+        if include_private:
+            docs = _feed_page(base, page_size, cursor)
+        else:
+            docs = _feed_page(base.where('visibility', '==', 'public'), page_size, cursor)
+            if viewer_id:
+                own_private = (
+                    base
+                    .where('userId', '==', viewer_id)
+                    .where('visibility', '==', 'novios')
+                )
+                docs += _feed_page(own_private, page_size, cursor)
+                docs.sort(key=lambda d: ((d.to_dict() or {}).get('createdAt') or '', d.id), reverse=True)
+                docs = docs[:page_size]
+
+        items = [_feed_item(doc.id, doc.to_dict() or {}) for doc in docs]
+
+        next_cursor = None
+        if len(docs) == page_size:
+            last = docs[-1]
+            next_cursor = _encode_feed_cursor((last.to_dict() or {}).get('createdAt') or '', last.id)
+
+        return _conditional_json({'items': items, 'nextCursor': next_cursor})
 
-    try:
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 
-        query = (
-            firebase_service.db
-            .collection('gallery')
-            .where('eventId', '==', event_id)
-            .order_by('createdAt', direction='DESCENDING')
-            .limit(200)
-        )
 
-        items = []
+def _iter_event_gallery(event_id: str, page_size: int = FEED_MAX_PAGE_SIZE):
+    """Todos los docs de galería del evento, paginando por cursor (más nuevos primero)."""
+    base = firebase_service.db.collection('gallery').where('eventId', '==', event_id)
+    cursor = None
+    while True:
+        docs = _feed_page(base, page_size, cursor)
+        yield from docs
+        if len(docs) < page_size:
+            return
+        last = docs[-1]
+        cursor = ((last.to_dict() or {}).get('createdAt') or '', last.id)
+
+
+def _export_entries(event_id: str):
+    for doc in _iter_event_gallery(event_id):
+        item = _feed_item(doc.id, doc.to_dict() or {})
+        url = item['mediaUrl'] or item['imageUrl']
+        if not url:
+            continue
+
+        media_type = item['mediaType']
+        ext = os.path.splitext(urlparse(url).path)[1].lower()
+        if not ext:
+            ext = '.mp4' if media_type == 'video' else '.jpg'
+
+        created_at = item['createdAt'] or ''
+        try:
+            date_time = datetime.fromisoformat(created_at).timetuple()[:6]
+        except ValueError:
+            date_time = (1980, 1, 1, 0, 0, 0)
+        if date_time[0] < 1980:
+            date_time = (1980, 1, 1, 0, 0, 0)
 
-        for doc in query.stream():
+        folder = 'videos' if media_type == 'video' else 'fotos'
+        stamp = created_at[:19].replace(':', '-') or 'sin-fecha'
+        yield f'{folder}/{stamp}_{doc.id}{ext}', url, date_time
 
-            data = doc.to_dict() or {}
-            visibility = (data.get('visibility') or 'public').strip().lower()
-            owner_id = (data.get('userId') or '').strip()
-            if visibility == 'novios' and not include_private and (not viewer_id or viewer_id != owner_id):
-                continue
-            created_at = data.get('createdAt')
 
-            if hasattr(created_at, 'isoformat'):
-                created_at = created_at.isoformat()
+@gallery_bp.route('/event/<event_id>/export.zip', methods=['GET'])
+def export_event_gallery(event_id):
+    """
+    Descarga toda la galería del evento en un ZIP (solo novios).
 
-            items.append({
-                'photoId': doc.id,
-                'imageUrl': data.get('imageUrl', ''),
-                'mediaUrl': data.get('mediaUrl', data.get('imageUrl', '')),
-                'mediaType': data.get('mediaType', 'image'),
-                'eventId': data.get('eventId', ''),
-                'userId': data.get('userId', ''),
-                'userName': data.get('userName', ''),
-                'visibility': visibility,
-                'createdAt': created_at,
-            })
+    Query:
+      - adminCode: código de novios
 
-        return jsonify({'items': items}), 200
+    El ZIP se arma en streaming: se pagina la colección gallery, se
+    descargan varios archivos a la vez y cada uno se envía apenas llega.
+    Las descargas que fallan quedan listadas en errores.txt.
+    """
+    admin_code = (request.args.get('adminCode') or '').strip().upper()
 
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+    if not event_id:
+        return jsonify({'error': 'eventId requerido'}), 400
+    if admin_code != _expected_admin_code(event_id):
+        return jsonify({'error': 'Código de novios inválido'}), 403
+
+    filename = f'galeria-{event_id}.zip'
+    return Response(
+        stream_zip(_export_entries(event_id)),
+        mimetype='application/zip',
+        headers={
+            'Content-Disposition': f'attachment; filename="{quote_plus(filename)}"',
+            'Cache-Control': 'no-store',
+            'X-Accel-Buffering': 'no',
+        },
+    )
 
 
 # ------------------------------
@@ -275,6 +1297,9 @@ def get_photo_likes(photo_id):
     """
     Devuelve número de likes y si un usuario concreto dio like.
 
+    Lee el contador gallery/{photoId}.likeCount (1 lectura) y, si se pide,
+    el doc likes/{userId} (1 lectura más).
+
     Parámetros de query:
       - userId (opcional): si se pasa, se evalúa userLiked.
 
@@ -287,14 +1312,11 @@ def get_photo_likes(photo_id):
     user_id = request.args.get('userId')
 
     try:
-        likes_ref = (
-            firebase_service.db
-            .collection('gallery')
-            .document(photo_id)
-            .collection('likes')
-        )
+        photo_ref = _photo_doc(photo_id)
+        likes_ref = photo_ref.collection('likes')
 
-        count = sum(1 for _ in likes_ref.stream())
+        photo_data = photo_ref.get().to_dict() or {}
+        count = _stored_counter(photo_data, 'likeCount', likes_ref)
         user_liked = False
 
         if user_id:
@@ -309,6 +1331,115 @@ def get_photo_likes(photo_id):
         return jsonify({'error': str(e)}), 500
 
 
+@gallery_bp.cli.command('repair-counters')
+@click.option('--event-id', default=None, help='Limita la reparación a un evento.')
+def repair_photo_counters(event_id):
+    """
+    Recalcula gallery/{photoId}.likeCount y commentCount desde las
+    subcolecciones likes y comments.
+
+    Uso:
+      flask --app app gallery repair-counters [--event-id EVENTO]
+    """
+    query = firebase_service.db.collection('gallery')
+    if event_id:
+        query = query.where('eventId', '==', event_id)
+
+    checked = 0
+    fixed = 0
+    for doc in query.stream():
+        checked += 1
+        data = doc.to_dict() or {}
+        counters = {
+            'likeCount': _count_docs(doc.reference.collection('likes')),
+            'commentCount': _count_docs(doc.reference.collection('comments')),
+        }
+        updates = {k: v for k, v in counters.items() if data.get(k) != v}
+        if updates:
+            doc.reference.update(updates)
+            fixed += 1
+            for field_name, value in updates.items():
+                click.echo(f'{doc.id}: {field_name} {data.get(field_name)} -> {value}')
+
+    click.echo(f'Fotos revisadas: {checked}, corregidas: {fixed}')
+
+
+@gallery_bp.route('/photos/engagement', methods=['POST'])
+def get_photos_engagement():
+    """
+    Likes, userLiked y comentarios de muchas fotos en una sola llamada.
+
+    Lee todos los docs gallery/{photoId} y likes/{viewerId} con un único
+    get_all; los contadores salen de likeCount/commentCount y solo las
+    fotos antiguas sin contador se cuentan, en paralelo.
+
+    Body JSON:
+    {
+      "photoIds": ["...", "..."],
+      "viewerId": "... (opcional)"
+    }
+
+    Respuesta:
+    {
+      "items": {
+        "<photoId>": { "likeCount": <int>, "userLiked": <bool>, "commentCount": <int> }
+      }
+    }
+    """
+    data = request.get_json(silent=True) or {}
+    raw_ids = data.get('photoIds') or []
+    viewer_id = (data.get('viewerId') or '').strip()
+
+    if not isinstance(raw_ids, list):
+        return jsonify({'error': 'photoIds debe ser una lista'}), 400
+
+    photo_ids = []
+    for raw in raw_ids:
+        photo_id = str(raw or '').strip()
+        if photo_id and '/' not in photo_id and photo_id not in photo_ids:
+            photo_ids.append(photo_id)
+    if len(photo_ids) > ENGAGEMENT_MAX_PHOTOS:
+        return jsonify({'error': f'Máximo {ENGAGEMENT_MAX_PHOTOS} fotos por llamada'}), 400
+    if not photo_ids:
+        return jsonify({'items': {}}), 200
+
+    try:
+        photo_refs = [_photo_doc(photo_id) for photo_id in photo_ids]
+        refs = list(photo_refs)
+        if viewer_id:
+            refs += [ref.collection('likes').document(viewer_id) for ref in photo_refs]
+
+        photo_data = {}
+        liked_ids = set()
+        for snap in firebase_service.db.get_all(refs):
+            if not snap.exists:
+                continue
+            if snap.reference.parent.id == 'likes':
+                liked_ids.add(snap.reference.parent.parent.id)
+            else:
+                photo_data[snap.id] = snap.to_dict() or {}
+
+        def engagement(photo_id: str) -> dict:
+            ref = _photo_doc(photo_id)
+            doc_data = photo_data.get(photo_id)
+            if doc_data is None:
+                return {'likeCount': 0, 'userLiked': False, 'commentCount': 0}
+            return {
+                'likeCount': _stored_counter(doc_data, 'likeCount', ref.collection('likes')),
+                'userLiked': photo_id in liked_ids,
+                'commentCount': _stored_counter(doc_data, 'commentCount', ref.collection('comments')),
+            }
+
+        with ThreadPoolExecutor(max_workers=ENGAGEMENT_WORKERS) as pool:
+            results = pool.map(engagement, photo_ids)
+            items = dict(zip(photo_ids, results))
+
+        return jsonify({'items': items}), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
 # ------------------------------
 # COMENTARIOS POR FOTO (gallery/{photoId}/comments)
 # ------------------------------
@@ -319,6 +1450,8 @@ def add_photo_comment(photo_id):
     Agrega un comentario a una foto en:
       gallery/{photoId}/comments/{autoId}
 
+    En la misma transacción incrementa gallery/{photoId}.commentCount.
+
     Body JSON:
     {
       "userId": "...",
@@ -335,22 +1468,19 @@ def add_photo_comment(photo_id):
         return jsonify({'error': 'photoId, userId y message son requeridos'}), 400
 
     try:
-        comments_ref = (
-            firebase_service.db
-            .collection('gallery')
-            .document(photo_id)
-            .collection('comments')
-        )
+        photo_ref = _photo_doc(photo_id)
+        doc_ref = photo_ref.collection('comments').document()
 
-        doc_ref = comments_ref.document()
-        doc_ref.set({
+        count = _add_comment_txn(firebase_service.db.transaction(), photo_ref, doc_ref, {
             'userId': user_id,
             'name': name,
             'message': message,
             'timestamp': datetime.now(timezone.utc).isoformat(),
         })
+        if count is None:
+            return jsonify({'error': 'Foto no encontrada'}), 404
 
-        return jsonify({'id': doc_ref.id}), 201
+        return jsonify({'id': doc_ref.id, 'count': count}), 201
 
     except Exception as e:
         return jsonify({'error': str(e)}), 400
@@ -362,18 +1492,38 @@ def get_photo_comments(photo_id):
     Lista comentarios de una foto:
       gallery/{photoId}/comments
 
-    Devuelve lista ordenada por timestamp ascendente.
+    Query params:
+      - limit (opcional): máximo de comentarios, por defecto 100 (máx. 200)
+      - before (opcional): id de un comentario; trae los anteriores a él
+
+    Devuelve los `limit` comentarios más recientes (anteriores a `before`)
+    en orden ascendente por timestamp. Para cargar más antiguos se pasa
+    como `before` el id del primer comentario recibido.
     """
+    before = (request.args.get('before') or '').strip()
     try:
-        comments_ref = (
-            firebase_service.db
-            .collection('gallery')
-            .document(photo_id)
-            .collection('comments')
+        limit = int(request.args.get('limit') or COMMENTS_DEFAULT_LIMIT)
+    except ValueError:
+        limit = COMMENTS_DEFAULT_LIMIT
+    limit = max(1, min(limit, COMMENTS_MAX_LIMIT))
+
+    try:
+        comments_ref = _photo_doc(photo_id).collection('comments')
+        query = (
+            comments_ref
+            .order_by('timestamp', direction=firestore.Query.DESCENDING)
+            .order_by(DOCUMENT_ID, direction=firestore.Query.DESCENDING)
         )
+        if before:
+            if '/' in before:
+                return jsonify({'error': 'before inválido'}), 400
+            cursor_snap = comments_ref.document(before).get()
+            if not cursor_snap.exists:
+                return jsonify({'error': 'before no encontrado'}), 400
+            query = query.start_after(cursor_snap)
 
         items = []
-        for doc in comments_ref.stream():
+        for doc in query.limit(limit).stream():
             data = doc.to_dict() or {}
             items.append({
                 'id': doc.id,
@@ -383,7 +1533,7 @@ def get_photo_comments(photo_id):
                 'timestamp': data.get('timestamp'),
             })
 
-        items.sort(key=lambda x: x.get('timestamp') or '')
+        items.reverse()
 
         return jsonify(items), 200
 
@@ -394,20 +1544,16 @@ def get_photo_comments(photo_id):
 @gallery_bp.route('/photos/<photo_id>/comments/count', methods=['GET'])
 def get_photo_comments_count(photo_id):
     """
-    Devuelve el número de comentarios de una foto sin traerlos.
+    Devuelve el número de comentarios de una foto sin traerlos
+    (contador gallery/{photoId}.commentCount, 1 lectura).
 
     Respuesta:
     { "count": <int> }
     """
     try:
-        comments_ref = (
-            firebase_service.db
-            .collection('gallery')
-            .document(photo_id)
-            .collection('comments')
-        )
-
-        count = sum(1 for _ in comments_ref.stream())
+        photo_ref = _photo_doc(photo_id)
+        photo_data = photo_ref.get().to_dict() or {}
+        count = _stored_counter(photo_data, 'commentCount', photo_ref.collection('comments'))
         return jsonify({'count': count}), 200
 
     except Exception as e:
@@ -418,24 +1564,83 @@ def get_photo_comments_count(photo_id):
 # CHECK-IN / LLEGADAS (events/{eventId}/...)
 # ------------------------------
 
+def _add_checkin_writes(batch, event_id: str, user_id: str, name: str, arrival_at: str,
+                        scanned_at: str = None) -> None:
+    """
+    Agrega al batch las 2 escrituras de un check-in (checkins + guests).
+
+    arrivalAt es siempre la hora del servidor (es el cursor de /arrivals?since);
+    la hora en que se escaneó sin conexión va aparte en scannedAt.
+    """
+    event_ref = firebase_service.db.collection('events').document(event_id)
+    batch.set(event_ref.collection('checkins').document(user_id), {
+        'name': name,
+        'timestamp': arrival_at,
+        'scannedAt': scanned_at or arrival_at,
+    })
+    batch.set(event_ref.collection('guests').document(user_id), {
+        'name': name,
+        'nameLower': name.lower(),
+        'status': 'arrived',
+        'arrivalAt': arrival_at,
+        'scannedAt': scanned_at or arrival_at,
+    }, merge=True)
+
+
+def _checkin_identity(event_id: str, data: dict):
+    """
+    (userId, nombre) del check-in: desde el token QR firmado si viene,
+    si no desde userId/name del body (salvo con CHECKIN_REQUIRE_TOKEN).
+
+    Raises:
+        InvalidCheckinToken
+    """
+    token = (data.get('token') or '').strip()
+    if token:
+        claims = checkin_tokens.verify(token, event_id)
+        return claims['guestId'], claims['name'] or (data.get('name') or '').strip() or 'Invitado'
+    if CHECKIN_REQUIRE_TOKEN:
+        raise InvalidCheckinToken('Token de check-in requerido')
+    return (data.get('userId') or '').strip(), (data.get('name') or '').strip() or 'Invitado'
+
+
+def _client_arrival_at(raw, fallback: str) -> str:
+    """Hora de llegada reportada por el cliente (ISO 8601), normalizada a UTC."""
+    if not raw:
+        return fallback
+    try:
+        parsed = datetime.fromisoformat(str(raw).replace('Z', '+00:00'))
+    except ValueError:
+        return fallback
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc).isoformat()
+
+
 @gallery_bp.route('/event/<event_id>/checkin', methods=['POST'])
 def event_checkin(event_id):
     """
     Marca llegada de un usuario al evento.
 
-    Escribe en:
+    Escribe en un solo batch (ambas o ninguna):
       - events/{eventId}/checkins/{userId}
       - events/{eventId}/guests/{userId} (merge status=arrived)
 
     Body JSON:
+    {
+      "token": "..."        (QR firmado, ver /checkin-tokens)
+    }
+    o bien:
     {
       "userId": "...",
       "name": "Nombre"
     }
     """
     data = request.get_json(silent=True) or {}
-    user_id = (data.get('userId') or '').strip()
-    name = (data.get('name') or '').strip() or 'Invitado'
+    try:
+        user_id, name = _checkin_identity(event_id, data)
+    except InvalidCheckinToken as e:
+        return jsonify({'error': str(e)}), 403
 
     if not event_id or not user_id:
         return jsonify({'error': 'eventId y userId son requeridos'}), 400
@@ -443,18 +1648,9 @@ def event_checkin(event_id):
     try:
         now_iso = datetime.now(timezone.utc).isoformat()
 
-        firebase_service.db.collection('events').document(event_id).collection('checkins').document(user_id).set({
-            'name': name,
-            'timestamp': now_iso,
-        })
-
-        firebase_service.db.collection('events').document(event_id).collection('guests').document(user_id).set({
-            'name': name,
-            'nameLower': name.lower(),
-            'status': 'arrived',
-            'arrivalAt': now_iso,
-            'tableNumber': '',
-        }, merge=True)
+        batch = firebase_service.db.batch()
+        _add_checkin_writes(batch, event_id, user_id, name, now_iso)
+        batch.commit()
 
         return jsonify({'ok': True, 'arrivalAt': now_iso}), 200
 
@@ -462,47 +1658,299 @@ def event_checkin(event_id):
         return jsonify({'error': str(e)}), 500
 
 
+@gallery_bp.route('/event/<event_id>/checkin/bulk', methods=['POST'])
+def event_checkin_bulk(event_id):
+    """
+    Sube una cola de check-ins hechos sin conexión en la puerta.
+
+    Cada check-in son 2 escrituras; se hacen commits de hasta BATCH_LIMIT
+    operaciones. Si un commit falla, solo sus items quedan con error y el
+    cliente puede reintentarlos.
+
+    Body JSON:
+    {
+      "checkins": [ { "token" | "userId", "name", "arrivalAt": "ISO opcional" }, ... ]
+    }
+
+    Respuesta:
+    {
+      "ok": true si todos quedaron guardados,
+      "results": [ { "index", "userId", "ok", "arrivalAt", "scannedAt" | "error" }, ... ]
+    }
+    """
+    data = request.get_json(silent=True) or {}
+    checkins = data.get('checkins')
+
+    if not event_id:
+        return jsonify({'error': 'eventId requerido'}), 400
+    if not isinstance(checkins, list) or not checkins:
+        return jsonify({'error': 'checkins debe ser una lista no vacía'}), 400
+    if len(checkins) > BULK_CHECKIN_MAX_ITEMS:
+        return jsonify({'error': f'Máximo {BULK_CHECKIN_MAX_ITEMS} check-ins por request'}), 400
+
+    now_iso = datetime.now(timezone.utc).isoformat()
+    results = []
+    valid = []
+    for index, item in enumerate(checkins):
+        item = item if isinstance(item, dict) else {}
+        result = {'index': index, 'userId': (item.get('userId') or '').strip(), 'ok': False}
+        results.append(result)
+        try:
+            user_id, name = _checkin_identity(event_id, item)
+        except InvalidCheckinToken as e:
+            result['error'] = str(e)
+            continue
+        result['userId'] = user_id
+        if not user_id:
+            result['error'] = 'userId requerido'
+            continue
+        result['arrivalAt'] = now_iso
+        result['scannedAt'] = _client_arrival_at(item.get('arrivalAt'), now_iso)
+        valid.append((result, name))
+
+    per_batch = BATCH_LIMIT // 2
+    for start in range(0, len(valid), per_batch):
+        chunk = valid[start:start + per_batch]
+        try:
+            batch = firebase_service.db.batch()
+            for result, name in chunk:
+                _add_checkin_writes(
+                    batch, event_id, result['userId'], name, result['arrivalAt'], result['scannedAt'],
+                )
+            batch.commit()
+            for result, _ in chunk:
+                result['ok'] = True
+        except Exception as e:
+            for result, _ in chunk:
+                result.pop('arrivalAt', None)
+                result.pop('scannedAt', None)
+                result['error'] = str(e)
+
+    return jsonify({
+        'ok': all(result['ok'] for result in results),
+        'results': results,
+    }), 200
+
+
+@gallery_bp.route('/event/<event_id>/checkin-tokens', methods=['POST'])
+def issue_checkin_tokens(event_id):
+    """
+    Emite los tokens QR firmados de check-in (solo novios).
+
+    Body JSON:
+    {
+      "adminCode": "...",
+      "guestIds": ["..."],     (opcional; por defecto todos los invitados)
+      "ttlSeconds": 86400      (opcional; entre 60 s y 365 días)
+    }
+
+    Respuesta:
+      { "items": [ { "guestId", "name", "token", "expiresAt" }, ... ],
+        "missing": [ guestIds que no existen ] }
+    """
+    data = request.get_json(silent=True) or {}
+    admin_code = (data.get('adminCode') or '').strip().upper()
+    guest_ids = data.get('guestIds')
+
+    if not event_id:
+        return jsonify({'error': 'eventId requerido'}), 400
+    if admin_code != _expected_admin_code(event_id):
+        return jsonify({'error': 'Código de novios inválido'}), 403
+    if guest_ids is not None and not isinstance(guest_ids, list):
+        return jsonify({'error': 'guestIds debe ser una lista'}), 400
+
+    if not checkin_tokens.enabled:
+        return jsonify({'error': 'Tokens de check-in no configurados'}), 503
+
+    try:
+        ttl_seconds = data.get('ttlSeconds')
+        ttl_seconds = None if ttl_seconds in (None, '') else int(ttl_seconds)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'ttlSeconds inválido'}), 400
+
+    try:
+        guests_ref = firebase_service.db.collection('events').document(event_id).collection('guests')
+        if guest_ids is None:
+            docs = guests_ref.select(['name']).stream()
+        else:
+            ids = [str(g).strip() for g in guest_ids if str(g or '').strip()]
+            docs = firebase_service.db.get_all([guests_ref.document(g) for g in ids], field_paths=['name'])
+
+        items = []
+        missing = []
+        for doc in docs:
+            # Un id que no está en la lista no recibe token.
+            if not doc.exists:
+                missing.append(doc.id)
+                continue
+            name = ((doc.to_dict() or {}).get('name') or '').strip()
+            issued = checkin_tokens.issue(event_id, doc.id, name, ttl_seconds)
+            items.append({'guestId': doc.id, 'name': name, **issued})
+
+        return jsonify({'items': items, 'missing': missing}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+def _arrivals_since(event_id: str, since: str):
+    """
+    Invitados con arrivalAt posterior a `since` (menos un margen), en orden.
+
+    El margen cubre check-ins de otro worker cuyo commit llegó después de uno
+    más nuevo; el cliente fusiona por userId, así que repetirlos no molesta.
+
+    Si la página viene llena el cursor es "arrivalAt|guestId" del último y
+    la siguiente llamada sigue justo después (start_after, sin margen): un
+    check-in masivo deja cientos de invitados con el mismo arrivalAt.
+
+    Returns:
+        (items, cursor, has_more)
+    """
+    arrival_at, _, guest_id = since.partition('|')
+    floor = datetime.fromisoformat(arrival_at.replace('Z', '+00:00'))
+    if floor.tzinfo is None:
+        floor = floor.replace(tzinfo=timezone.utc)
+
+    guests_ref = firebase_service.db.collection('events').document(event_id).collection('guests')
+    query = guests_ref.where('status', '==', 'arrived')
+    if guest_id:
+        query = query.order_by('arrivalAt').order_by(DOCUMENT_ID).start_after({
+            'arrivalAt': arrival_at,
+            DOCUMENT_ID: guests_ref.document(guest_id),
+        })
+    else:
+        floor = (floor.astimezone(timezone.utc) - timedelta(seconds=ARRIVALS_SYNC_OVERLAP_SECONDS)).isoformat()
+        query = query.where('arrivalAt', '>', floor).order_by('arrivalAt').order_by(DOCUMENT_ID)
+
+    docs = list(query.limit(ARRIVALS_SYNC_LIMIT).stream())
+    items = [arrival_from_doc(doc) for doc in docs]
+    if len(docs) == ARRIVALS_SYNC_LIMIT:
+        return items, f"{items[-1]['arrivalAt']}|{docs[-1].id}", True
+
+    cursor = max([arrival_at] + [item['arrivalAt'] for item in items if item['arrivalAt']])
+    return items, cursor, False
+
+
 @gallery_bp.route('/event/<event_id>/arrivals', methods=['GET'])
 def event_arrivals(event_id):
     """
     Lista quiénes ya llegaron (para demo).
 
     Query:
-      - q (opcional): filtra por nombre (contiene)
+      - q (opcional): filtra por nombre (sin tildes, vía índice de invitados)
+      - since (opcional): cursor (opaco) de la respuesta anterior; solo
+        devuelve llegadas nuevas (incluye unos segundos de solape: fusionar
+        por userId). Con hasMore=true repetir con el cursor nuevo.
 
     Respuesta:
-      { "items": [ { "userId", "name", "arrivalAt" }, ... ] }
+      { "items": [ { "userId", "name", "arrivalAt" }, ... ], "cursor": "...", "hasMore": false }
     """
-    q = (request.args.get('q') or '').strip().lower()
+    q = (request.args.get('q') or '').strip()
+    since = (request.args.get('since') or '').strip()
 
     if not event_id:
         return jsonify({'error': 'eventId requerido'}), 400
 
     try:
-        guests_ref = firebase_service.db.collection('events').document(event_id).collection('guests')
-        # Firestore no soporta contains; para demo filtramos en servidor.
-        stream = guests_ref.where('status', '==', 'arrived').stream()
-
-        items = []
-        for doc in stream:
-            data = doc.to_dict() or {}
-            name = (data.get('name') or '').strip()
-            arrival_at = data.get('arrivalAt') or data.get('timestamp')
-            row = {
-                'userId': doc.id,
-                'name': name or 'Invitado',
-                'arrivalAt': arrival_at,
-            }
-            if q:
-                if q not in (name.lower() if name else ''):
-                    continue
-            items.append(row)
+        if since and not q:
+            try:
+                items, cursor, has_more = _arrivals_since(event_id, since)
+            except ValueError:
+                return jsonify({'error': 'since inválido'}), 400
+            return jsonify({'items': items, 'cursor': cursor, 'hasMore': has_more}), 200
+
+        if q:
+            items = [
+                {
+                    'userId': guest['guestId'],
+                    'name': guest['name'],
+                    'arrivalAt': guest['arrivalAt'],
+                }
+                for guest in guest_search.search(event_id, q, limit=ARRIVALS_SEARCH_LIMIT, status='arrived')
+            ]
+        else:
+            guests_ref = firebase_service.db.collection('events').document(event_id).collection('guests')
+            items = [arrival_from_doc(doc) for doc in guests_ref.where('status', '==', 'arrived').stream()]
 
         # Orden: más recientes primero si se puede
         items.sort(key=lambda x: x.get('arrivalAt') or '', reverse=True)
+        # Con q la lista es parcial: no sirve como punto de partida del delta.
+        cursor = None if q else (items[0]['arrivalAt'] if items and items[0]['arrivalAt'] else None)
 
-        return jsonify({'items': items}), 200
+        return jsonify({'items': items, 'cursor': cursor, 'hasMore': False}), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@gallery_bp.route('/event/<event_id>/arrivals/stream', methods=['GET'])
+def event_arrivals_stream(event_id):
+    """
+    Llegadas en vivo por Server-Sent Events (recepción, teléfono de los novios).
+
+    Todos los clientes de un evento comparten un listener de Firestore.
+
+    Eventos:
+      - snapshot: { "items": [ { "userId", "name", "arrivalAt" }, ... ] } al conectar
+      - arrival: { "userId", "name", "arrivalAt" }
+      - departure: { "userId" }
+
+    El stream se cierra cada pocos minutos; EventSource reconecta solo y
+    recibe un snapshot nuevo. Si el servidor ya tiene demasiados streams
+    abiertos responde 503: el cliente debe seguir con GET /arrivals.
+    """
+    if not event_id:
+        return jsonify({'error': 'eventId requerido'}), 400
+
+    if not stream_slots.acquire():
+        return jsonify({'error': 'Demasiadas conexiones en vivo, usa /arrivals'}), 503, {'Retry-After': '30'}
+
+    try:
+        subscriber, current = arrivals_hub.subscribe(event_id)
+    except Exception as e:
+        stream_slots.release()
+        return jsonify({'error': str(e)}), 500
+
+    def generate():
+        try:
+            yield from stream_queue(subscriber, initial=[('snapshot', {'items': current})])
+        finally:
+            arrivals_hub.unsubscribe(event_id, subscriber)
+
+    response = Response(generate(), mimetype='text/event-stream', headers=SSE_HEADERS)
+    response.call_on_close(stream_slots.release)
+    return response
+
+
+@gallery_bp.route('/event/<event_id>/guests/search', methods=['GET'])
+def search_event_guests(event_id):
+    """
+    Busca invitados por nombre (sin tildes ni mayúsculas, por prefijo o
+    parte del nombre), con su mesa.
+
+    Query:
+      - q: texto a buscar
+      - limit (opcional): máximo de resultados (10 por defecto, hasta 50)
+      - status (opcional): p.ej. arrived
+
+    Respuesta:
+      { "items": [ { "guestId", "name", "tableNumber", "status", "arrivalAt" }, ... ] }
+    """
+    q = (request.args.get('q') or '').strip()
+    status = (request.args.get('status') or '').strip() or None
+    try:
+        limit = int(request.args.get('limit') or GUEST_SEARCH_DEFAULT_LIMIT)
+    except ValueError:
+        return jsonify({'error': 'limit inválido'}), 400
+    limit = max(1, min(limit, GUEST_SEARCH_MAX_LIMIT))
+
+    if not event_id:
+        return jsonify({'error': 'eventId requerido'}), 400
+    if not q:
+        return jsonify({'items': []}), 200
 
+    try:
+        return jsonify({'items': guest_search.search(event_id, q, limit=limit, status=status)}), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -511,6 +1959,78 @@ def event_arrivals(event_id):
 # LISTA DE NOVIOS (events/{eventId}/settings)
 # ------------------------------
 
+def _settings_doc(event_id: str):
+    return (
+        firebase_service.db
+        .collection('events')
+        .document(event_id)
+        .collection('settings')
+        .document('public')
+    )
+
+
+def _public_settings(event_id: str) -> dict:
+    """Lee events/{eventId}/settings/public, con cache en memoria (TTL)."""
+    return public_settings_cache.get_or_load(
+        event_id,
+        lambda: _settings_doc(event_id).get().to_dict() or {},
+    )
+
+
+def _location_from_settings(data: dict, prefix: str):
+    latitude = data.get(f'{prefix}Latitude')
+    longitude = data.get(f'{prefix}Longitude')
+    label = (data.get(f'{prefix}Label') or '').strip()
+    if latitude is None or longitude is None:
+        return None
+
+    latitude = float(latitude)
+    longitude = float(longitude)
+    return {
+        'latitude': latitude,
+        'longitude': longitude,
+        'label': label,
+        'wazeUrl': _waze_url(latitude, longitude),
+    }
+
+
+def _set_public_settings(event_id: str, payload: dict) -> None:
+    _settings_doc(event_id).set(payload, merge=True)
+    public_settings_cache.invalidate(event_id)
+
+
+@gallery_bp.route('/event/<event_id>/public', methods=['GET'])
+def get_event_public_settings(event_id):
+    """
+    Datos públicos del evento en una sola llamada (home del invitado).
+
+    Lee desde:
+      events/{eventId}/settings/public
+
+    Respuesta (con ETag y Cache-Control públicos):
+    {
+      "registryUrl": "...",
+      "location": { latitude, longitude, label, wazeUrl } | null,
+      "churchLocation": { latitude, longitude, label, wazeUrl } | null
+    }
+    """
+    if not event_id:
+        return jsonify({'error': 'eventId requerido'}), 400
+
+    try:
+        data = _public_settings(event_id)
+        return _conditional_json(
+            {
+                'registryUrl': data.get('registryUrl', ''),
+                'location': _location_from_settings(data, 'venue'),
+                'churchLocation': _location_from_settings(data, 'ceremony'),
+            },
+            cache_control=f'public, max-age={PUBLIC_SETTINGS_TTL_SECONDS}',
+        )
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
 @gallery_bp.route('/event/<event_id>/registry', methods=['GET'])
 def get_event_registry(event_id):
     """
@@ -523,15 +2043,7 @@ def get_event_registry(event_id):
         return jsonify({'error': 'eventId requerido'}), 400
 
     try:
-        doc = (
-            firebase_service.db
-            .collection('events')
-            .document(event_id)
-            .collection('settings')
-            .document('public')
-            .get()
-        )
-        data = doc.to_dict() or {}
+        data = _public_settings(event_id)
         return jsonify({'registryUrl': data.get('registryUrl', '')}), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -557,10 +2069,10 @@ def set_event_registry(event_id):
         return jsonify({'error': 'URL inválida'}), 400
 
     try:
-        firebase_service.db.collection('events').document(event_id).collection('settings').document('public').set({
+        _set_public_settings(event_id, {
             'registryUrl': registry_url,
             'updatedAt': datetime.now(timezone.utc).isoformat(),
-        }, merge=True)
+        })
         return jsonify({'ok': True}), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -578,31 +2090,8 @@ def get_event_location(event_id):
         return jsonify({'error': 'eventId requerido'}), 400
 
     try:
-        doc = (
-            firebase_service.db
-            .collection('events')
-            .document(event_id)
-            .collection('settings')
-            .document('public')
-            .get()
-        )
-        data = doc.to_dict() or {}
-        latitude = data.get('venueLatitude')
-        longitude = data.get('venueLongitude')
-        label = (data.get('venueLabel') or '').strip()
-        if latitude is None or longitude is None:
-            return jsonify({'location': None}), 200
-
-        latitude = float(latitude)
-        longitude = float(longitude)
-        return jsonify({
-            'location': {
-                'latitude': latitude,
-                'longitude': longitude,
-                'label': label,
-                'wazeUrl': _waze_url(latitude, longitude),
-            }
-        }), 200
+        data = _public_settings(event_id)
+        return jsonify({'location': _location_from_settings(data, 'venue')}), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -619,31 +2108,8 @@ def get_event_church_location(event_id):
         return jsonify({'error': 'eventId requerido'}), 400
 
     try:
-        doc = (
-            firebase_service.db
-            .collection('events')
-            .document(event_id)
-            .collection('settings')
-            .document('public')
-            .get()
-        )
-        data = doc.to_dict() or {}
-        latitude = data.get('ceremonyLatitude')
-        longitude = data.get('ceremonyLongitude')
-        label = (data.get('ceremonyLabel') or '').strip()
-        if latitude is None or longitude is None:
-            return jsonify({'location': None}), 200
-
-        latitude = float(latitude)
-        longitude = float(longitude)
-        return jsonify({
-            'location': {
-                'latitude': latitude,
-                'longitude': longitude,
-                'label': label,
-                'wazeUrl': _waze_url(latitude, longitude),
-            }
-        }), 200
+        data = _public_settings(event_id)
+        return jsonify({'location': _location_from_settings(data, 'ceremony')}), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -684,10 +2150,7 @@ def set_event_location(event_id):
             'wazeUrl': _waze_url(latitude, longitude),
             'updatedAt': datetime.now(timezone.utc).isoformat(),
         }
-        firebase_service.db.collection('events').document(event_id).collection('settings').document('public').set(
-            payload,
-            merge=True,
-        )
+        _set_public_settings(event_id, payload)
         return jsonify({
             'ok': True,
             'location': {
@@ -737,10 +2200,7 @@ def set_event_church_location(event_id):
             'ceremonyWazeUrl': _waze_url(latitude, longitude),
             'updatedAt': datetime.now(timezone.utc).isoformat(),
         }
-        firebase_service.db.collection('events').document(event_id).collection('settings').document('public').set(
-            payload,
-            merge=True,
-        )
+        _set_public_settings(event_id, payload)
         return jsonify({
             'ok': True,
             'location': {
@@ -757,7 +2217,8 @@ def set_event_church_location(event_id):
 @gallery_bp.route('/geocode', methods=['GET'])
 def geocode_location():
     """
-    Busca lugares por texto usando Nominatim (OpenStreetMap).
+    Busca lugares por texto usando Nominatim (OpenStreetMap), a través del
+    gateway de services/geocoding (cache, single-flight y rate limit).
 
     Query params:
       q: texto a buscar
@@ -775,31 +2236,9 @@ def geocode_location():
         limit = 5
 
     try:
-        url = (
-            'https://nominatim.openstreetmap.org/search'
-            f'?format=jsonv2&limit={limit}&q={quote_plus(query)}'
-        )
-        req = Request(
-            url,
-            headers={
-                'User-Agent': 'wedding-app/1.0',
-                'Accept': 'application/json',
-            },
-        )
-        with urlopen(req, timeout=10) as response:
-            payload = json.loads(response.read().decode('utf-8'))
-
-        items = []
-        for item in payload[:limit]:
-            try:
-                items.append({
-                    'label': item.get('display_name', ''),
-                    'latitude': float(item.get('lat')),
-                    'longitude': float(item.get('lon')),
-                })
-            except Exception:
-                continue
-
+        items = geocoder.search(query, limit)
         return jsonify({'items': items}), 200
+    except GeocodingRateLimited as exc:
+        return jsonify({'error': str(exc)}), 429
     except Exception as e:
         return jsonify({'error': str(e)}), 500
\ No newline at end of file
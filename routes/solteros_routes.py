@@ -11,13 +11,32 @@ Todo acceso de lectura/escritura exige que el viewer esté en la lista de solter
 del evento (anti-sapeo).
 """
 
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify
+import random
 from datetime import datetime, timezone
 
-from services.firebase_service import FirebaseService
+from firebase_admin import firestore
+from google.api_core.exceptions import AlreadyExists
+
+from services.chat_broker import build_chat_hub
+from services.firebase_service import BATCH_LIMIT, FirebaseService
+from services.sse import SSE_HEADERS, stream_queue, stream_slots
+from services.ttl_cache import TTLCache
 
 solteros_bp = Blueprint("solteros", __name__)
 firebase_service = FirebaseService()
+chat_hub = build_chat_hub(firebase_service.db)
+
+# Membresía de solteros por (eventId, userId). El modo es irreversible: un
+# positivo se cachea para siempre; un negativo solo unos segundos (otro
+# worker puede activarlo y este no se entera).
+SINGLES_NEGATIVE_TTL_SECONDS = 5
+singles_cache = TTLCache(ttl=SINGLES_NEGATIVE_TTL_SECONDS, max_entries=20000)
+_NOT_CACHED = object()
+
+# Contador de mensajes del chat global repartido en shards: cada post
+# incrementa uno al azar, así no se concentra la escritura en un doc.
+GLOBAL_CHAT_COUNTER_SHARDS = 10
 
 
 def _now_iso() -> str:
@@ -34,10 +53,30 @@ def _singles_doc(event_id: str, user_id: str):
     )
 
 
+def _remember_single(event_id: str, user_id: str, name: str) -> None:
+    singles_cache.set((event_id, user_id), {"name": name}, ttl=None)
+
+
+def _single_profile(event_id: str, user_id: str):
+    """{"name"} del soltero o None si no activó el modo (cacheado)."""
+    key = (event_id, user_id)
+    profile = singles_cache.get(key, _NOT_CACHED)
+    if profile is not _NOT_CACHED:
+        return profile
+
+    snap = _singles_doc(event_id, user_id).get()
+    if not snap.exists:
+        singles_cache.set(key, None)
+        return None
+    name = ((snap.to_dict() or {}).get("name") or "").strip()
+    _remember_single(event_id, user_id, name)
+    return {"name": name}
+
+
 def _require_single(event_id: str, viewer_id: str):
     if not viewer_id:
         return False
-    return _singles_doc(event_id, viewer_id).get().exists
+    return _single_profile(event_id, viewer_id) is not None
 
 
 def _thread_id(a: str, b: str) -> str:
@@ -56,6 +95,118 @@ def _dm_doc(event_id: str, a: str, b: str):
     )
 
 
+def _global_counter_shard(event_id: str, shard: int):
+    return _global_chat_doc(event_id).collection("counter_shards").document(str(shard))
+
+
+def _global_reader_doc(event_id: str, user_id: str):
+    """
+    Marca de lectura del chat global por usuario:
+      - readCount: total de mensajes al marcar leído
+      - sentCount: mensajes enviados por el usuario (siempre crece)
+      - sentAtRead: sentCount al marcar leído
+    """
+    return _global_chat_doc(event_id).collection("readers").document(user_id)
+
+
+def _global_unread_state(event_id: str, viewer_id: str):
+    """
+    Lee la marca del viewer y los shards en un solo get_all (mismo instante).
+
+    Returns:
+        (total de mensajes, datos del reader)
+    """
+    reader_ref = _global_reader_doc(event_id, viewer_id)
+    shard_refs = [_global_counter_shard(event_id, i) for i in range(GLOBAL_CHAT_COUNTER_SHARDS)]
+    reader_data, total = {}, 0
+    for snap in firebase_service.db.get_all([reader_ref, *shard_refs]):
+        data = snap.to_dict() or {}
+        if snap.reference.path == reader_ref.path:
+            reader_data = data
+        else:
+            total += int(data.get("count") or 0)
+    return total, reader_data
+
+
+def _global_unread_count(total: int, reader: dict) -> int:
+    """Mensajes de otros desde la última lectura (los propios no cuentan)."""
+    own_since_read = int(reader.get("sentCount") or 0) - int(reader.get("sentAtRead") or 0)
+    return max(0, total - int(reader.get("readCount") or 0) - own_since_read)
+
+
+def _inbox_doc(event_id: str, user_id: str):
+    """events/{eventId}/singles_inbox/{userId}: índice de DMs del usuario."""
+    return (
+        firebase_service.db
+        .collection("events")
+        .document(event_id)
+        .collection("singles_inbox")
+        .document(user_id)
+    )
+
+
+def _inbox_entry(event_id: str, user_id: str, other_user_id: str):
+    return _inbox_doc(event_id, user_id).collection("threads").document(_thread_id(user_id, other_user_id))
+
+
+def _backfill_inbox(event_id: str, viewer_id: str) -> None:
+    """
+    Primera vez que se lista: indexa los DMs creados antes del inbox.
+
+    Usa array_contains sobre participantIds, así que lee solo los hilos propios.
+    Solo crea las entradas que faltan: las que ya escribió post_dm_message
+    (con su unreadCount exacto) no se tocan.
+    """
+    inbox_doc = _inbox_doc(event_id, viewer_id)
+    if inbox_doc.get().exists:
+        return
+
+    threads = (
+        firebase_service.db
+        .collection("events")
+        .document(event_id)
+        .collection("singles_dm")
+        .where("participantIds", "array_contains", viewer_id)
+        .stream()
+    )
+    candidates = []
+    for doc in threads:
+        data = doc.to_dict() or {}
+        other_user_id = next((uid for uid in data.get("participantIds") or [] if uid != viewer_id), "")
+        if other_user_id:
+            candidates.append((_inbox_entry(event_id, viewer_id, other_user_id), other_user_id, doc.id, data))
+
+    existing = set()
+    for start in range(0, len(candidates), BATCH_LIMIT):
+        refs = [ref for ref, _, _, _ in candidates[start:start + BATCH_LIMIT]]
+        existing.update(snap.reference.path for snap in firebase_service.db.get_all(refs) if snap.exists)
+
+    for entry_ref, other_user_id, thread_id, data in candidates:
+        if entry_ref.path in existing:
+            continue
+        names = data.get("participantNames") or {}
+        last_message_at = (data.get("lastMessageAt") or "").strip()
+        last_sender_id = (data.get("lastSenderId") or "").strip()
+        last_read_map = data.get("lastReadAt") or {}
+        viewer_last_read = (last_read_map.get(viewer_id) or "").strip() if isinstance(last_read_map, dict) else ""
+        unread = bool(last_message_at and last_sender_id and last_sender_id != viewer_id and last_message_at > viewer_last_read)
+        try:
+            # create(): si un post la escribe entre medio, gana la del post.
+            entry_ref.create({
+                "threadId": thread_id,
+                "otherUserId": other_user_id,
+                "otherName": (names.get(other_user_id) if isinstance(names, dict) else "") or "",
+                "lastMessage": (data.get("lastMessage") or "").strip(),
+                "lastMessageAt": last_message_at,
+                "lastSenderId": last_sender_id,
+                "unreadCount": 1 if unread else 0,
+            })
+        except AlreadyExists:
+            continue
+
+    inbox_doc.set({"userId": viewer_id, "indexedAt": _now_iso()}, merge=True)
+
+
 def _global_chat_doc(event_id: str):
     return (
         firebase_service.db
@@ -66,11 +217,88 @@ def _global_chat_doc(event_id: str):
     )
 
 
+def _global_channel(event_id: str) -> str:
+    return f"events/{event_id}/singles_chat/global/messages"
+
+
+def _dm_channel(event_id: str, a: str, b: str) -> str:
+    return f"events/{event_id}/singles_dm/{_thread_id(a, b)}/messages"
+
+
+def _message_stream(channel: str, messages_ref, after: str):
+    """
+    Respuesta SSE de un hilo: primero lo posterior a `after` (lo que el
+    cliente no alcanzó a ver), luego los mensajes en vivo. Eventos "message".
+
+    Sin cupo de streams en el proceso responde 503: el cliente sigue con
+    polling de /messages.
+    """
+    if not stream_slots.acquire():
+        return jsonify({"error": "Demasiadas conexiones en vivo, usa /messages"}), 503, {"Retry-After": "30"}
+
+    try:
+        subscriber = chat_hub.listen(channel)
+    except Exception:
+        stream_slots.release()
+        raise
+    try:
+        backlog = _message_page(messages_ref, after, "", 200) if after else []
+    except Exception:
+        chat_hub.stop(channel, subscriber)
+        stream_slots.release()
+        raise
+    # Un mensaje puede llegar por la cola y también en el backlog.
+    sent_ids = {m["id"] for m in backlog}
+
+    def generate():
+        try:
+            yield from stream_queue(
+                subscriber,
+                initial=[("message", m) for m in backlog],
+                skip=lambda event, data: data.get("id") in sent_ids,
+            )
+        finally:
+            chat_hub.stop(channel, subscriber)
+
+    response = Response(generate(), mimetype="text/event-stream", headers=SSE_HEADERS)
+    response.call_on_close(stream_slots.release)
+    return response
+
+
+def _message_item(doc) -> dict:
+    data = doc.to_dict() or {}
+    return {
+        "id": doc.id,
+        "userId": data.get("userId", ""),
+        "name": data.get("name", "Invitado"),
+        "text": data.get("text", ""),
+        "createdAt": data.get("createdAt") or "",
+    }
+
+
+def _message_page(messages_ref, after: str, before: str, limit: int):
+    """
+    Los últimos `limit` mensajes en orden cronológico, con createdAt en el
+    rango (after, before). Consulta ordenada: solo se leen los que se devuelven.
+    """
+    query = messages_ref.order_by("createdAt")
+    if after:
+        query = query.where("createdAt", ">", after)
+    if before:
+        query = query.where("createdAt", "<", before)
+    # limit_to_last no admite stream(): get() devuelve la lista ya en orden.
+    return [_message_item(doc) for doc in query.limit_to_last(limit).get()]
+
+
+def _last_message(messages_ref):
+    docs = list(messages_ref.order_by("createdAt", direction=firestore.Query.DESCENDING).limit(1).stream())
+    return _message_item(docs[0]) if docs else None
+
+
 def _single_name(event_id: str, user_id: str, fallback: str = "Invitado") -> str:
     try:
-        snap = _singles_doc(event_id, user_id).get()
-        data = snap.to_dict() or {}
-        return (data.get("name") or "").strip() or fallback
+        profile = _single_profile(event_id, user_id) or {}
+        return profile.get("name") or fallback
     except Exception:
         return fallback
 
@@ -88,6 +316,8 @@ def activate_single(event_id):
         ref = _singles_doc(event_id, user_id)
         snap = ref.get()
         if snap.exists:
+            stored_name = ((snap.to_dict() or {}).get("name") or "").strip()
+            _remember_single(event_id, user_id, stored_name)
             return jsonify({"ok": True, "already": True}), 200
 
         ref.set({
@@ -96,6 +326,7 @@ def activate_single(event_id):
             "nameLower": name.lower(),
             "activatedAt": _now_iso(),
         })
+        _remember_single(event_id, user_id, name)
         return jsonify({"ok": True, "already": False}), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -132,8 +363,18 @@ def list_singles(event_id):
 
 @solteros_bp.route("/event/<event_id>/chat/messages", methods=["GET"])
 def get_global_chat_messages(event_id):
+    """
+    Mensajes del chat global en orden cronológico.
+
+    Query:
+      - viewerId
+      - after (opcional): solo mensajes con createdAt posterior (polling)
+      - before (opcional): solo anteriores (scroll hacia atrás)
+      - limit (opcional): máximo 200; se devuelven los más recientes del rango
+    """
     viewer_id = (request.args.get("viewerId") or "").strip()
     after = (request.args.get("after") or "").strip()
+    before = (request.args.get("before") or "").strip()
     limit = int(request.args.get("limit") or 60)
     limit = max(1, min(limit, 200))
 
@@ -143,30 +384,37 @@ def get_global_chat_messages(event_id):
         return jsonify({"error": "Solo disponible para solteros"}), 403
 
     try:
-        ref = (
-            firebase_service.db
-            .collection("events")
-            .document(event_id)
-            .collection("singles_chat")
-            .document("global")
-            .collection("messages")
+        ref = _global_chat_doc(event_id).collection("messages")
+        items = _message_page(ref, after, before, limit)
+        return jsonify({"items": items, "hasMore": len(items) == limit}), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@solteros_bp.route("/event/<event_id>/chat/stream", methods=["GET"])
+def stream_global_chat(event_id):
+    """
+    Mensajes nuevos del chat global por Server-Sent Events (evento "message").
+
+    Query:
+      - viewerId
+      - after (opcional): createdAt del último mensaje visto; se envía primero
+        lo que falte desde ahí
+    """
+    viewer_id = (request.args.get("viewerId") or "").strip()
+    after = (request.args.get("after") or "").strip()
+
+    if not event_id:
+        return jsonify({"error": "eventId requerido"}), 400
+    if not _require_single(event_id, viewer_id):
+        return jsonify({"error": "Solo disponible para solteros"}), 403
+
+    try:
+        return _message_stream(
+            _global_channel(event_id),
+            _global_chat_doc(event_id).collection("messages"),
+            after,
         )
-        # Para mantenerlo simple (y por demo), traemos un rango acotado y filtramos por ISO string.
-        raw = []
-        for doc in ref.stream():
-            data = doc.to_dict() or {}
-            raw.append({
-                "id": doc.id,
-                "userId": data.get("userId", ""),
-                "name": data.get("name", "Invitado"),
-                "text": data.get("text", ""),
-                "createdAt": data.get("createdAt") or "",
-            })
-        raw.sort(key=lambda x: x.get("createdAt") or "")
-        if after:
-            raw = [m for m in raw if (m.get("createdAt") or "") > after]
-        raw = raw[-limit:]
-        return jsonify({"items": raw}), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -187,20 +435,28 @@ def post_global_chat_message(event_id):
         chat_doc = _global_chat_doc(event_id)
         ref = chat_doc.collection("messages").document()
         now = _now_iso()
-        ref.set({
+
+        # Mensaje y contadores en un commit: un lector nunca ve uno sin el otro.
+        # No se toca singles_chat/global: el último mensaje se lee en /status
+        # con una consulta ordenada, así ningún doc se escribe en cada post.
+        batch = firebase_service.db.batch()
+        batch.set(ref, {
+            "userId": viewer_id,
+            "name": viewer_name,
+            "text": text,
+            "createdAt": now,
+        })
+        shard = random.randrange(GLOBAL_CHAT_COUNTER_SHARDS)
+        batch.set(_global_counter_shard(event_id, shard), {"count": firestore.Increment(1)}, merge=True)
+        batch.set(_global_reader_doc(event_id, viewer_id), {"sentCount": firestore.Increment(1)}, merge=True)
+        batch.commit()
+        chat_hub.publish(_global_channel(event_id), {
+            "id": ref.id,
             "userId": viewer_id,
             "name": viewer_name,
             "text": text,
             "createdAt": now,
         })
-        chat_doc.set({
-            "lastMessage": text,
-            "lastMessageAt": now,
-            "lastSenderId": viewer_id,
-            "lastReadAt": {
-                viewer_id: now,
-            },
-        }, merge=True)
         return jsonify({"ok": True, "id": ref.id, "createdAt": now}), 201
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -216,33 +472,12 @@ def get_global_chat_status(event_id):
         return jsonify({"error": "Solo disponible para solteros"}), 403
 
     try:
-        snap = _global_chat_doc(event_id).get()
-        data = snap.to_dict() or {}
-        last_message = (data.get("lastMessage") or "").strip()
-        last_message_at = (data.get("lastMessageAt") or "").strip()
-        last_sender_id = (data.get("lastSenderId") or "").strip()
-        last_read_map = data.get("lastReadAt") or {}
-        viewer_last_read = (last_read_map.get(viewer_id) or "").strip() if isinstance(last_read_map, dict) else ""
-        if not last_message_at or not last_message:
-            raw = []
-            for doc in _global_chat_doc(event_id).collection("messages").stream():
-                msg_data = doc.to_dict() or {}
-                raw.append({
-                    "text": (msg_data.get("text") or "").strip(),
-                    "createdAt": (msg_data.get("createdAt") or "").strip(),
-                    "userId": (msg_data.get("userId") or "").strip(),
-                })
-            raw.sort(key=lambda x: x.get("createdAt") or "")
-            if raw:
-                last = raw[-1]
-                last_message = last_message or last.get("text") or ""
-                last_message_at = last_message_at or last.get("createdAt") or ""
-                last_sender_id = last_sender_id or last.get("userId") or ""
-        unread = bool(last_message_at and last_sender_id and last_sender_id != viewer_id and last_message_at > viewer_last_read)
+        total, reader = _global_unread_state(event_id, viewer_id)
+        last = _last_message(_global_chat_doc(event_id).collection("messages")) or {}
         return jsonify({
-            "lastMessage": last_message,
-            "lastMessageAt": last_message_at,
-            "unreadCount": 1 if unread else 0,
+            "lastMessage": (last.get("text") or "").strip(),
+            "lastMessageAt": last.get("createdAt") or "",
+            "unreadCount": _global_unread_count(total, reader),
         }), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -259,14 +494,14 @@ def mark_global_chat_read(event_id):
         return jsonify({"error": "Solo disponible para solteros"}), 403
 
     try:
-        chat_doc = _global_chat_doc(event_id)
-        snap = chat_doc.get()
-        base = snap.to_dict() or {}
-        mark_at = (base.get("lastMessageAt") or "").strip() or _now_iso()
-        chat_doc.set({
-            "lastReadAt": {
-                viewer_id: mark_at,
-            },
+        total, reader = _global_unread_state(event_id, viewer_id)
+        mark_at = _now_iso()
+        # Solo readCount/sentAtRead: un post concurrente sigue sumando a
+        # sentCount sin pisarse con esta escritura.
+        _global_reader_doc(event_id, viewer_id).set({
+            "readCount": total,
+            "sentAtRead": int(reader.get("sentCount") or 0),
+            "readAt": mark_at,
         }, merge=True)
         return jsonify({"ok": True, "readAt": mark_at}), 200
     except Exception as e:
@@ -275,8 +510,10 @@ def mark_global_chat_read(event_id):
 
 @solteros_bp.route("/event/<event_id>/dm/<other_user_id>/messages", methods=["GET"])
 def get_dm_messages(event_id, other_user_id):
+    """Mensajes del DM; mismos parámetros after/before/limit que el chat global."""
     viewer_id = (request.args.get("viewerId") or "").strip()
     after = (request.args.get("after") or "").strip()
+    before = (request.args.get("before") or "").strip()
     limit = int(request.args.get("limit") or 60)
     limit = max(1, min(limit, 200))
 
@@ -289,21 +526,31 @@ def get_dm_messages(event_id, other_user_id):
 
     try:
         ref = _dm_doc(event_id, viewer_id, other_user_id).collection("messages")
-        raw = []
-        for doc in ref.stream():
-            data = doc.to_dict() or {}
-            raw.append({
-                "id": doc.id,
-                "userId": data.get("userId", ""),
-                "name": data.get("name", "Invitado"),
-                "text": data.get("text", ""),
-                "createdAt": data.get("createdAt") or "",
-            })
-        raw.sort(key=lambda x: x.get("createdAt") or "")
-        if after:
-            raw = [m for m in raw if (m.get("createdAt") or "") > after]
-        raw = raw[-limit:]
-        return jsonify({"items": raw}), 200
+        items = _message_page(ref, after, before, limit)
+        return jsonify({"items": items, "hasMore": len(items) == limit}), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@solteros_bp.route("/event/<event_id>/dm/<other_user_id>/stream", methods=["GET"])
+def stream_dm(event_id, other_user_id):
+    """Mensajes nuevos del DM por Server-Sent Events; mismos parámetros que el chat global."""
+    viewer_id = (request.args.get("viewerId") or "").strip()
+    after = (request.args.get("after") or "").strip()
+
+    if not event_id or not other_user_id:
+        return jsonify({"error": "eventId y otherUserId son requeridos"}), 400
+    if not _require_single(event_id, viewer_id):
+        return jsonify({"error": "Solo disponible para solteros"}), 403
+    if not _require_single(event_id, other_user_id):
+        return jsonify({"error": "El usuario no está en modo soltero"}), 403
+
+    try:
+        return _message_stream(
+            _dm_channel(event_id, viewer_id, other_user_id),
+            _dm_doc(event_id, viewer_id, other_user_id).collection("messages"),
+            after,
+        )
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -323,20 +570,30 @@ def post_dm_message(event_id, other_user_id):
 
     try:
         viewer_name = _single_name(event_id, viewer_id, fallback="Invitado")
+        other_name = _single_name(event_id, other_user_id)
         thread_doc = _dm_doc(event_id, viewer_id, other_user_id)
         ref = thread_doc.collection("messages").document()
         now = _now_iso()
-        ref.set({
+        summary = {
+            "threadId": thread_doc.id,
+            "lastMessage": text,
+            "lastMessageAt": now,
+            "lastSenderId": viewer_id,
+        }
+
+        # Mensaje, resumen del hilo y las dos entradas de inbox en un commit.
+        batch = firebase_service.db.batch()
+        batch.set(ref, {
             "userId": viewer_id,
             "name": viewer_name,
             "text": text,
             "createdAt": now,
         })
-        thread_doc.set({
+        batch.set(thread_doc, {
             "participantIds": [viewer_id, other_user_id],
             "participantNames": {
                 viewer_id: viewer_name,
-                other_user_id: _single_name(event_id, other_user_id),
+                other_user_id: other_name,
             },
             "lastMessage": text,
             "lastMessageAt": now,
@@ -345,6 +602,26 @@ def post_dm_message(event_id, other_user_id):
                 viewer_id: now,
             },
         }, merge=True)
+        batch.set(_inbox_entry(event_id, viewer_id, other_user_id), {
+            **summary,
+            "otherUserId": other_user_id,
+            "otherName": other_name,
+            "unreadCount": 0,
+        }, merge=True)
+        batch.set(_inbox_entry(event_id, other_user_id, viewer_id), {
+            **summary,
+            "otherUserId": viewer_id,
+            "otherName": viewer_name,
+            "unreadCount": firestore.Increment(1),
+        }, merge=True)
+        batch.commit()
+        chat_hub.publish(_dm_channel(event_id, viewer_id, other_user_id), {
+            "id": ref.id,
+            "userId": viewer_id,
+            "name": viewer_name,
+            "text": text,
+            "createdAt": now,
+        })
         return jsonify({"ok": True, "id": ref.id, "createdAt": now}), 201
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -367,11 +644,15 @@ def mark_dm_read(event_id, other_user_id):
         snap = thread_doc.get()
         base = snap.to_dict() or {}
         mark_at = (base.get("lastMessageAt") or "").strip() or _now_iso()
-        thread_doc.set({
+        batch = firebase_service.db.batch()
+        batch.set(thread_doc, {
             "lastReadAt": {
                 viewer_id: mark_at,
             },
         }, merge=True)
+        if snap.exists:
+            batch.set(_inbox_entry(event_id, viewer_id, other_user_id), {"unreadCount": 0}, merge=True)
+        batch.commit()
         return jsonify({"ok": True, "readAt": mark_at}), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -379,6 +660,12 @@ def mark_dm_read(event_id, other_user_id):
 
 @solteros_bp.route("/event/<event_id>/conversations", methods=["GET"])
 def get_dm_conversations(event_id):
+    """
+    DMs del viewer, más recientes primero.
+
+    Lee events/{eventId}/singles_inbox/{viewerId}/threads (un doc por hilo
+    propio, mantenido por post_dm_message), no todos los DMs del evento.
+    """
     viewer_id = (request.args.get("viewerId") or "").strip()
 
     if not event_id:
@@ -387,60 +674,28 @@ def get_dm_conversations(event_id):
         return jsonify({"error": "Solo disponible para solteros"}), 403
 
     try:
-        ref = (
-            firebase_service.db
-            .collection("events")
-            .document(event_id)
-            .collection("singles_dm")
+        _backfill_inbox(event_id, viewer_id)
+        entries = (
+            _inbox_doc(event_id, viewer_id)
+            .collection("threads")
+            .order_by("lastMessageAt", direction=firestore.Query.DESCENDING)
+            .stream()
         )
         items = []
-        for doc in ref.stream():
+        for doc in entries:
             data = doc.to_dict() or {}
-            participant_ids = [str(x).strip() for x in (data.get("participantIds") or []) if str(x).strip()]
-            if not participant_ids and "_" in doc.id:
-                participant_ids = [part.strip() for part in doc.id.split("_") if part.strip()]
-            if viewer_id not in participant_ids:
-                continue
-            other_user_id = next((uid for uid in participant_ids if uid != viewer_id), "")
+            other_user_id = (data.get("otherUserId") or "").strip()
             if not other_user_id:
                 continue
-            participant_names = data.get("participantNames") or {}
-            other_name = ""
-            if isinstance(participant_names, dict):
-                other_name = (participant_names.get(other_user_id) or "").strip()
-            other_name = other_name or _single_name(event_id, other_user_id)
-            last_message_at = (data.get("lastMessageAt") or "").strip()
-            last_message = (data.get("lastMessage") or "").strip()
-            last_sender_id = (data.get("lastSenderId") or "").strip()
-            last_read_map = data.get("lastReadAt") or {}
-            viewer_last_read = (last_read_map.get(viewer_id) or "").strip() if isinstance(last_read_map, dict) else ""
-            if not last_message_at or not last_message:
-                raw = []
-                for msg_doc in doc.reference.collection("messages").stream():
-                    msg_data = msg_doc.to_dict() or {}
-                    raw.append({
-                        "text": (msg_data.get("text") or "").strip(),
-                        "createdAt": (msg_data.get("createdAt") or "").strip(),
-                        "userId": (msg_data.get("userId") or "").strip(),
-                    })
-                raw.sort(key=lambda x: x.get("createdAt") or "")
-                if raw:
-                    last = raw[-1]
-                    last_message = last_message or last.get("text") or ""
-                    last_message_at = last_message_at or last.get("createdAt") or ""
-                    last_sender_id = last_sender_id or last.get("userId") or ""
-            unread = bool(last_message_at and last_sender_id and last_sender_id != viewer_id and last_message_at > viewer_last_read)
+            other_name = (data.get("otherName") or "").strip() or _single_name(event_id, other_user_id)
             items.append({
-                "threadId": doc.id,
+                "threadId": data.get("threadId") or doc.id,
                 "otherUserId": other_user_id,
                 "otherName": other_name or "Invitado",
-                "lastMessage": last_message,
-                "lastMessageAt": last_message_at,
-                "unreadCount": 1 if unread else 0,
+                "lastMessage": (data.get("lastMessage") or "").strip(),
+                "lastMessageAt": (data.get("lastMessageAt") or "").strip(),
+                "unreadCount": max(0, int(data.get("unreadCount") or 0)),
             })
-
-        items.sort(key=lambda x: x.get("lastMessageAt") or "", reverse=True)
         return jsonify({"items": items}), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
-
@@ -0,0 +1,116 @@
+"""
+Llegadas en vivo
+================
+
+Un solo listener on_snapshot de Firestore por evento (guests con
+status == arrived), compartido por todos los clientes conectados al stream.
+N pantallas mirando las llegadas cuestan un listener, no N consultas.
+
+El listener se abre con el primer suscriptor y se cierra con el último.
+"""
+
+import queue
+import threading
+
+from services.sse import SUBSCRIBER_QUEUE_SIZE, SubscriberOverflow, offer
+
+
+def arrival_from_doc(doc) -> dict:
+    data = doc.to_dict() or {}
+    return {
+        'userId': doc.id,
+        'name': (data.get('name') or '').strip() or 'Invitado',
+        'arrivalAt': data.get('arrivalAt') or data.get('timestamp'),
+    }
+
+
+class _EventFeed:
+    def __init__(self):
+        self.subscribers = set()
+        self.arrivals = {}
+        self.ready = threading.Event()
+        self.watch = None
+
+
+class ArrivalsHub:
+    """Reparte los cambios de llegadas de cada evento a sus suscriptores."""
+
+    def __init__(self, db):
+        self.db = db
+        self._feeds = {}
+        # Reentrante: on_snapshot puede llamar al callback antes de retornar.
+        self._lock = threading.RLock()
+
+    def _query(self, event_id: str):
+        return (
+            self.db
+            .collection('events')
+            .document(event_id)
+            .collection('guests')
+            .where('status', '==', 'arrived')
+        )
+
+    def subscribe(self, event_id: str, timeout: float = 10):
+        """
+        Returns:
+            (cola del suscriptor, lista actual de llegadas)
+        """
+        subscriber = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            feed = self._feeds.get(event_id)
+            if feed is None:
+                feed = self._feeds[event_id] = _EventFeed()
+                feed.watch = self._query(event_id).on_snapshot(
+                    lambda docs, changes, read_time: self._on_snapshot(feed, changes)
+                )
+            feed.subscribers.add(subscriber)
+
+        feed.ready.wait(timeout)
+        with self._lock:
+            current = sorted(feed.arrivals.values(), key=lambda a: a['arrivalAt'] or '', reverse=True)
+        return subscriber, current
+
+    def unsubscribe(self, event_id: str, subscriber) -> None:
+        with self._lock:
+            feed = self._feeds.get(event_id)
+            if feed is None:
+                return
+            feed.subscribers.discard(subscriber)
+            if feed.subscribers:
+                return
+            del self._feeds[event_id]
+        try:
+            feed.watch.unsubscribe()
+        except Exception as e:
+            print('Error cerrando listener de llegadas:', e)
+
+    def _on_snapshot(self, feed: _EventFeed, changes) -> None:
+        messages = []
+        with self._lock:
+            for change in changes:
+                doc = change.document
+                if change.type.name == 'REMOVED':
+                    if feed.arrivals.pop(doc.id, None) is not None and feed.ready.is_set():
+                        messages.append(('departure', {'userId': doc.id}))
+                    continue
+                arrival = arrival_from_doc(doc)
+                previous = feed.arrivals.get(doc.id)
+                feed.arrivals[doc.id] = arrival
+                if feed.ready.is_set() and previous != arrival:
+                    messages.append(('arrival', arrival))
+
+            # La primera llamada es el estado inicial: va en el snapshot de
+            # cada suscriptor, no como eventos sueltos.
+            feed.ready.set()
+            subscribers = list(feed.subscribers)
+
+        for subscriber in subscribers:
+            for message in messages:
+                if not offer(subscriber, message):
+                    # Deja lugar para el aviso de cierre.
+                    try:
+                        subscriber.get_nowait()
+                    except queue.Empty:
+                        pass
+                    offer(subscriber, SubscriberOverflow())
+                    break
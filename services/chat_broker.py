@@ -0,0 +1,162 @@
+"""
+Entrega en vivo del chat de solteros
+====================================
+
+Los clientes conectados al stream de un hilo (chat global o DM) reciben
+los mensajes nuevos sin hacer polling.
+
+- ChatHub: por proceso, una sola suscripción al broker por hilo; los
+  clientes conectados a ese hilo se reparten desde ahí.
+- Broker intercambiable (CHAT_BROKER):
+    firestore — (por defecto) un listener on_snapshot por hilo sobre su
+                colección de mensajes; funciona con varios workers porque
+                escribir el mensaje ya es publicarlo.
+    memory    — en proceso; los post_* publican directo. Solo para un
+                worker y para pruebas: con WEB_CONCURRENCY > 1 no arranca.
+
+El canal es la ruta de la colección de mensajes del hilo, p.ej.
+events/{eventId}/singles_chat/global/messages.
+"""
+
+import os
+import queue
+import threading
+from datetime import datetime, timezone
+
+from services.sse import SUBSCRIBER_QUEUE_SIZE, SubscriberOverflow, offer
+
+
+class MessageBroker:
+    """Interfaz: publish(channel, message) y subscribe(channel, callback) -> cancelar()"""
+
+    def publish(self, channel: str, message: dict) -> None:
+        raise NotImplementedError
+
+    def subscribe(self, channel: str, callback):
+        raise NotImplementedError
+
+
+class InMemoryBroker(MessageBroker):
+    """Entrega sincrónica dentro del proceso."""
+
+    def __init__(self):
+        self._callbacks = {}
+        self._lock = threading.Lock()
+
+    def publish(self, channel: str, message: dict) -> None:
+        with self._lock:
+            callbacks = list(self._callbacks.get(channel, ()))
+        for callback in callbacks:
+            callback(message)
+
+    def subscribe(self, channel: str, callback):
+        with self._lock:
+            self._callbacks.setdefault(channel, []).append(callback)
+
+        def cancel():
+            with self._lock:
+                callbacks = self._callbacks.get(channel, [])
+                if callback in callbacks:
+                    callbacks.remove(callback)
+                if not callbacks:
+                    self._callbacks.pop(channel, None)
+
+        return cancel
+
+
+class FirestoreBroker(MessageBroker):
+    """Escucha la colección del canal; publish no hace nada (ya se escribió)."""
+
+    def __init__(self, db):
+        self.db = db
+
+    def publish(self, channel: str, message: dict) -> None:
+        pass
+
+    def subscribe(self, channel: str, callback):
+        since = datetime.now(timezone.utc).isoformat()
+
+        def on_snapshot(docs, changes, read_time):
+            for change in changes:
+                if change.type.name != 'ADDED':
+                    continue
+                data = change.document.to_dict() or {}
+                callback({
+                    'id': change.document.id,
+                    'userId': data.get('userId', ''),
+                    'name': data.get('name', 'Invitado'),
+                    'text': data.get('text', ''),
+                    'createdAt': data.get('createdAt') or '',
+                })
+
+        watch = (
+            self.db.collection(channel)
+            .where('createdAt', '>', since)
+            .order_by('createdAt')
+            .on_snapshot(on_snapshot)
+        )
+        return watch.unsubscribe
+
+
+class ChatHub:
+    """Reparte los mensajes de cada canal a las colas de sus clientes."""
+
+    def __init__(self, broker: MessageBroker):
+        self.broker = broker
+        self._channels = {}
+        # Reentrante: un broker puede entregar durante subscribe().
+        self._lock = threading.RLock()
+
+    def publish(self, channel: str, message: dict) -> None:
+        try:
+            self.broker.publish(channel, message)
+        except Exception as e:
+            print('Error publicando mensaje de chat:', e)
+
+    def listen(self, channel: str) -> queue.Queue:
+        subscriber = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            entry = self._channels.get(channel)
+            if entry is None:
+                entry = self._channels[channel] = {'subscribers': set(), 'cancel': None}
+                entry['cancel'] = self.broker.subscribe(channel, lambda m: self._deliver(channel, m))
+            entry['subscribers'].add(subscriber)
+        return subscriber
+
+    def stop(self, channel: str, subscriber) -> None:
+        with self._lock:
+            entry = self._channels.get(channel)
+            if entry is None:
+                return
+            entry['subscribers'].discard(subscriber)
+            if entry['subscribers']:
+                return
+            del self._channels[channel]
+        try:
+            entry['cancel']()
+        except Exception as e:
+            print('Error cerrando suscripción de chat:', e)
+
+    def _deliver(self, channel: str, message: dict) -> None:
+        with self._lock:
+            entry = self._channels.get(channel)
+            subscribers = list(entry['subscribers']) if entry else []
+        for subscriber in subscribers:
+            if not offer(subscriber, ('message', message)):
+                try:
+                    subscriber.get_nowait()
+                except queue.Empty:
+                    pass
+                offer(subscriber, SubscriberOverflow())
+
+
+def build_chat_hub(db) -> ChatHub:
+    """Hub según CHAT_BROKER (firestore por defecto, o memory)."""
+    broker_name = (os.environ.get('CHAT_BROKER') or 'firestore').strip().lower()
+    if broker_name != 'memory':
+        return ChatHub(FirestoreBroker(db))
+
+    # Con varios workers cada uno vería solo los mensajes que él recibió.
+    if int(os.environ.get('WEB_CONCURRENCY') or '1') > 1:
+        raise RuntimeError('CHAT_BROKER=memory requiere un solo worker; usa CHAT_BROKER=firestore')
+    return ChatHub(InMemoryBroker())
@@ -0,0 +1,120 @@
+"""
+Tokens QR de check-in
+=====================
+
+Payload firmado con HMAC-SHA256 que va en el QR de cada invitado:
+
+    base64url(json {e: eventId, g: guestId, n: nombre, x: expira}) . base64url(firma)
+
+La verificación es local (sin Firestore): el escáner de la puerta sigue
+funcionando a la misma velocidad aunque Firestore esté lento.
+
+La clave sale de CHECKIN_TOKEN_SECRET o SECRET_KEY. Sin ninguna de las dos
+no se emiten ni se aceptan tokens. Con CHECKIN_REQUIRE_TOKEN=1 el check-in
+exige token (no acepta userId suelto).
+"""
+
+import base64
+import hashlib
+import hmac
+import json
+import os
+import time
+
+MIN_TOKEN_TTL_SECONDS = 60
+MAX_TOKEN_TTL_SECONDS = 365 * 24 * 60 * 60
+
+CHECKIN_TOKEN_TTL_SECONDS = int(os.environ.get('CHECKIN_TOKEN_TTL_SECONDS', str(30 * 24 * 60 * 60)))
+
+CHECKIN_REQUIRE_TOKEN = (os.environ.get('CHECKIN_REQUIRE_TOKEN') or '').strip().lower() in {'1', 'true', 'yes'}
+
+
+class InvalidCheckinToken(Exception):
+    """Token mal formado, con firma inválida, expirado o de otro evento."""
+
+
+class CheckinTokensDisabled(InvalidCheckinToken):
+    """No hay clave configurada: no se emiten ni aceptan tokens."""
+
+
+def clamp_ttl(ttl_seconds: int) -> int:
+    return min(max(int(ttl_seconds), MIN_TOKEN_TTL_SECONDS), MAX_TOKEN_TTL_SECONDS)
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+class CheckinTokenSigner:
+    """Emite y verifica tokens de check-in con una clave compartida."""
+
+    def __init__(self, secret: str = None, ttl_seconds: int = CHECKIN_TOKEN_TTL_SECONDS):
+        secret = secret or os.environ.get('CHECKIN_TOKEN_SECRET') or os.environ.get('SECRET_KEY')
+        self._key = secret.encode('utf-8') if secret else None
+        self.ttl_seconds = clamp_ttl(ttl_seconds)
+
+    @property
+    def enabled(self) -> bool:
+        return self._key is not None
+
+    def _sign(self, body: str) -> str:
+        if self._key is None:
+            raise CheckinTokensDisabled('Tokens de check-in no configurados')
+        digest = hmac.new(self._key, body.encode('ascii'), hashlib.sha256).digest()
+        return _b64encode(digest)
+
+    def issue(self, event_id: str, guest_id: str, name: str = '', ttl_seconds: int = None) -> dict:
+        """
+        `ttl_seconds` se acota a [MIN_TOKEN_TTL_SECONDS, MAX_TOKEN_TTL_SECONDS].
+
+        Returns:
+            { token, expiresAt (epoch s) }
+
+        Raises:
+            CheckinTokensDisabled
+        """
+        ttl = self.ttl_seconds if ttl_seconds is None else clamp_ttl(ttl_seconds)
+        expires_at = int(time.time()) + ttl
+        payload = {'e': event_id, 'g': guest_id, 'n': name or '', 'x': expires_at}
+        body = _b64encode(json.dumps(payload, separators=(',', ':'), ensure_ascii=False).encode('utf-8'))
+        return {'token': f'{body}.{self._sign(body)}', 'expiresAt': expires_at}
+
+    def verify(self, token: str, event_id: str) -> dict:
+        """
+        Valida firma, evento y expiración.
+
+        Returns:
+            { guestId, name, expiresAt }
+
+        Raises:
+            InvalidCheckinToken (o CheckinTokensDisabled sin clave)
+        """
+        if self._key is None:
+            raise CheckinTokensDisabled('Tokens de check-in no configurados')
+        body, _, signature = (token or '').strip().partition('.')
+        if not body or not signature:
+            raise InvalidCheckinToken('Token de check-in mal formado')
+        if not hmac.compare_digest(signature, self._sign(body)):
+            raise InvalidCheckinToken('Token de check-in inválido')
+
+        try:
+            payload = json.loads(_b64decode(body).decode('utf-8'))
+        except (ValueError, UnicodeDecodeError) as exc:
+            raise InvalidCheckinToken('Token de check-in mal formado') from exc
+
+        if payload.get('e') != event_id:
+            raise InvalidCheckinToken('El token es de otro evento')
+        if int(payload.get('x') or 0) < time.time():
+            raise InvalidCheckinToken('Token de check-in expirado')
+        if not payload.get('g'):
+            raise InvalidCheckinToken('Token de check-in mal formado')
+
+        return {
+            'guestId': payload['g'],
+            'name': payload.get('n') or '',
+            'expiresAt': int(payload['x']),
+        }
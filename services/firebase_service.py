@@ -1,10 +1,18 @@
 import os
 import json
+import re
+from urllib.parse import unquote, urlparse
 import firebase_admin
 import cloudinary
 import cloudinary.uploader
 from firebase_admin import credentials, firestore, storage
 
+# Tamaño de chunk para subidas resumables a Storage (múltiplo de 256 KB).
+UPLOAD_CHUNK_SIZE = 4 * 1024 * 1024
+
+# Máximo de operaciones por WriteBatch de Firestore.
+BATCH_LIMIT = 500
+
 
 class FirebaseService:
     def __init__(self):
@@ -70,21 +78,26 @@ class FirebaseService:
     def delete_document(self, collection, doc_id):
         self.db.collection(collection).document(doc_id).delete()
 
+    def delete_collection(self, collection_ref, batch_size=BATCH_LIMIT):
+        """Borra todos los docs de una (sub)colección en WriteBatch de hasta 500."""
+        deleted = 0
+        while True:
+            docs = list(collection_ref.select([]).limit(batch_size).stream())
+            if not docs:
+                return deleted
+            batch = self.db.batch()
+            for doc in docs:
+                batch.delete(doc.reference)
+            batch.commit()
+            deleted += len(docs)
+            if len(docs) < batch_size:
+                return deleted
+
     # ---------- Storage ----------
 
     def upload_file(self, file_path, destination_path, content_type=None, resource_type=None):
         if self.storage_provider == "cloudinary":
-            public_id = self._cloudinary_public_id(destination_path)
-            rt = (resource_type or "image").strip().lower()
-            if rt not in {"image", "video", "raw", "auto"}:
-                rt = "auto"
-            upload_result = cloudinary.uploader.upload(
-                file_path,
-                public_id=public_id,
-                overwrite=False,
-                resource_type=rt,
-            )
-            return upload_result.get("secure_url") or upload_result.get("url")
+            return self._cloudinary_upload(file_path, destination_path, resource_type)
 
         if not self.bucket:
             raise Exception("Firebase Storage no configurado")
@@ -99,10 +112,29 @@ class FirebaseService:
 
         return blob.public_url
 
-    def delete_file(self, file_path):
+    def upload_fileobj(self, file_obj, destination_path, content_type=None, resource_type=None, size=None):
+        """Sube desde un objeto tipo archivo (sin pasar por disco), en chunks."""
+        if self.storage_provider == "cloudinary":
+            return self._cloudinary_upload(file_obj, destination_path, resource_type)
+
+        if not self.bucket:
+            raise Exception("Firebase Storage no configurado")
+
+        blob = self.bucket.blob(destination_path, chunk_size=UPLOAD_CHUNK_SIZE)
+
+        if content_type:
+            blob.content_type = content_type
+
+        blob.upload_from_file(file_obj, size=size, content_type=content_type)
+        blob.make_public()
+
+        return blob.public_url
+
+    def delete_file(self, file_path, resource_type=None):
         if self.storage_provider == "cloudinary":
             public_id = self._cloudinary_public_id(file_path)
-            cloudinary.uploader.destroy(public_id, invalidate=True)
+            rt = (resource_type or "image").strip().lower()
+            cloudinary.uploader.destroy(public_id, invalidate=True, resource_type=rt)
             return
 
         if not self.bucket:
@@ -110,6 +142,32 @@ class FirebaseService:
 
         self.bucket.blob(file_path).delete()
 
+    def storage_path_from_url(self, url):
+        """Ruta de destino original a partir de la URL pública (docs antiguos)."""
+        parsed = urlparse(url or "")
+        path = unquote(parsed.path or "").lstrip("/")
+        if self.storage_provider == "cloudinary":
+            # /<cloud>/<resource_type>/upload/v123/<public_id>.<ext>
+            match = re.search(r"/upload/(?:v\d+/)?(.+)$", "/" + path)
+            return match.group(1) if match else None
+        if self.bucket and path.startswith(f"{self.bucket.name}/"):
+            return path[len(self.bucket.name) + 1:]
+        return None
+
+    def _cloudinary_upload(self, source, destination_path, resource_type=None):
+        # source puede ser una ruta o un objeto tipo archivo
+        public_id = self._cloudinary_public_id(destination_path)
+        rt = (resource_type or "image").strip().lower()
+        if rt not in {"image", "video", "raw", "auto"}:
+            rt = "auto"
+        upload_result = cloudinary.uploader.upload(
+            source,
+            public_id=public_id,
+            overwrite=False,
+            resource_type=rt,
+        )
+        return upload_result.get("secure_url") or upload_result.get("url")
+
     def _cloudinary_public_id(self, destination_path):
         # Quita extensión para usar public_id consistente
         folder = os.path.dirname(destination_path)
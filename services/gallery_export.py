@@ -0,0 +1,117 @@
+"""
+Exportación ZIP de la galería
+=============================
+
+Arma un ZIP en streaming mientras descarga los archivos:
+- Descargas concurrentes con un máximo de archivos en vuelo.
+- Cada entrada se escribe apenas su descarga termina y los bytes del ZIP
+  se entregan al response de inmediato; el archivo nunca existe completo.
+- Las fotos se guardan en memoria; los videos grandes pasan por un
+  SpooledTemporaryFile mientras esperan su turno.
+"""
+
+import os
+import shutil
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from tempfile import SpooledTemporaryFile
+from urllib.request import Request, urlopen
+
+EXPORT_WORKERS = int(os.environ.get('EXPORT_WORKERS', '4'))
+
+# Por encima de esto una descarga en espera pasa a disco.
+SPOOL_MAX_BYTES = 8 * 1024 * 1024
+
+COPY_CHUNK_BYTES = 1024 * 1024
+DOWNLOAD_TIMEOUT_SECONDS = 60
+
+
+class _ZipSink:
+    """Destino no seekable para ZipFile; acumula bytes hasta el próximo drain."""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def download_to_spool(url: str):
+    req = Request(url, headers={'User-Agent': 'wedding-app/1.0'})
+    spool = SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+    try:
+        with urlopen(req, timeout=DOWNLOAD_TIMEOUT_SECONDS) as response:
+            shutil.copyfileobj(response, spool, COPY_CHUNK_BYTES)
+        spool.seek(0)
+        return spool
+    except Exception:
+        spool.close()
+        raise
+
+
+def stream_zip(entries, max_workers: int = EXPORT_WORKERS):
+    """
+    Genera los bytes de un ZIP con los archivos de `entries`.
+
+    Args:
+        entries: iterable de (nombre_en_zip, url, date_time) — se consume
+            de a poco, así puede venir de una consulta paginada
+        max_workers: descargas simultáneas (y archivos en espera)
+
+    Yields:
+        Bloques de bytes del ZIP, en orden
+    """
+    sink = _ZipSink()
+    failed = []
+    entries = iter(entries)
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='gallery-export') as pool, \
+            zipfile.ZipFile(sink, mode='w', compression=zipfile.ZIP_STORED, allowZip64=True) as zf:
+        in_flight = {}
+
+        def fill():
+            while len(in_flight) < max_workers:
+                entry = next(entries, None)
+                if entry is None:
+                    return
+                in_flight[pool.submit(download_to_spool, entry[1])] = entry
+
+        fill()
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                name, url, date_time = in_flight.pop(future)
+                try:
+                    spool = future.result()
+                except Exception as e:
+                    failed.append(f'{name}\t{url}\t{e}')
+                    continue
+
+                with spool:
+                    info = zipfile.ZipInfo(name, date_time=date_time)
+                    info.compress_type = zipfile.ZIP_STORED
+                    with zf.open(info, mode='w', force_zip64=True) as dest:
+                        for chunk in iter(lambda: spool.read(COPY_CHUNK_BYTES), b''):
+                            dest.write(chunk)
+                            yield sink.drain()
+                yield sink.drain()
+            fill()
+
+        if failed:
+            zf.writestr('errores.txt', '\n'.join(failed) + '\n')
+
+    yield sink.drain()
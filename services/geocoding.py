@@ -0,0 +1,378 @@
+"""
+Servicio de geocoding
+=====================
+
+Gateway de búsqueda de lugares (para "Cómo llegar") delante de Nominatim:
+- Cache LRU en memoria con TTL, respaldada por SQLite local, con la
+  consulta normalizada como llave.
+- Single-flight: consultas idénticas en vuelo comparten una sola llamada.
+- Token bucket global (compartido por todos los workers vía SQLite) para
+  respetar la política de 1 request/segundo de Nominatim.
+- Proveedores intercambiables; GEOCODING_PROVIDER=fake usa uno local
+  sin red, para desarrollo y pruebas, con la misma cache y rate limit
+  (en su propio archivo SQLite).
+"""
+
+import http.client
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from urllib.parse import urlencode
+
+GEOCODE_CACHE_PATH = os.environ.get(
+    'GEOCODE_CACHE_PATH',
+    os.path.join(tempfile.gettempdir(), 'geocode-cache.sqlite3'),
+)
+FAKE_GEOCODE_CACHE_PATH = os.path.join(tempfile.gettempdir(), 'geocode-cache-fake.sqlite3')
+GEOCODE_CACHE_TTL_SECONDS = int(os.environ.get('GEOCODE_CACHE_TTL_SECONDS', str(7 * 24 * 60 * 60)))
+GEOCODE_NEGATIVE_TTL_SECONDS = 60 * 60
+GEOCODE_MEMORY_ENTRIES = 1024
+
+# Siempre se piden MAX_RESULTS al proveedor y se recorta después:
+# así una consulta ocupa una sola entrada de cache para cualquier limit.
+MAX_RESULTS = 10
+
+NOMINATIM_HOST = 'nominatim.openstreetmap.org'
+NOMINATIM_RATE_PER_SECOND = 1.0
+NOMINATIM_TIMEOUT_SECONDS = 10
+USER_AGENT = 'wedding-app/1.0'
+
+
+class GeocodingRateLimited(Exception):
+    """No hubo cupo en el rate limit dentro del tiempo de espera."""
+
+
+def normalize_query(query: str) -> str:
+    text = unicodedata.normalize('NFKC', query or '').casefold()
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+# ---------- Proveedores ----------
+
+class GeocodingProvider:
+    """Interfaz: search(query, limit) -> [{label, latitude, longitude}]"""
+
+    name = 'base'
+
+    def search(self, query: str, limit: int) -> list:
+        raise NotImplementedError
+
+
+class NominatimProvider(GeocodingProvider):
+    """Nominatim (OpenStreetMap) con una conexión HTTPS reutilizada por hilo."""
+
+    name = 'nominatim'
+
+    def __init__(self, host: str = NOMINATIM_HOST, timeout: float = NOMINATIM_TIMEOUT_SECONDS):
+        self.host = host
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self) -> http.client.HTTPSConnection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = http.client.HTTPSConnection(self.host, timeout=self.timeout)
+            self._local.conn = conn
+        return conn
+
+    def _get(self, path: str) -> bytes:
+        headers = {
+            'User-Agent': USER_AGENT,
+            'Accept': 'application/json',
+            'Connection': 'keep-alive',
+        }
+        for attempt in range(2):
+            conn = self._connection()
+            try:
+                conn.request('GET', path, headers=headers)
+                response = conn.getresponse()
+                body = response.read()
+            except http.client.BadStatusLine:
+                # Incluye RemoteDisconnected: el servidor cerró la conexión
+                # keep-alive ociosa. Un reintento con conexión nueva.
+                self._reset(conn)
+                if attempt:
+                    raise
+                continue
+            except (http.client.HTTPException, OSError):
+                # Timeouts y demás errores no se reintentan: el request pudo
+                # llegar y cada intento gasta cupo del rate limit.
+                self._reset(conn)
+                raise
+            if response.status != 200:
+                raise Exception(f'Nominatim respondió {response.status}')
+            return body
+
+    def _reset(self, conn: http.client.HTTPSConnection) -> None:
+        conn.close()
+        self._local.conn = None
+
+    def search(self, query: str, limit: int) -> list:
+        path = '/search?' + urlencode({'format': 'jsonv2', 'limit': limit, 'q': query})
+        payload = json.loads(self._get(path).decode('utf-8'))
+
+        items = []
+        for item in payload[:limit]:
+            try:
+                items.append({
+                    'label': item.get('display_name', ''),
+                    'latitude': float(item.get('lat')),
+                    'longitude': float(item.get('lon')),
+                })
+            except Exception:
+                continue
+        return items
+
+
+class FakeGeocodingProvider(GeocodingProvider):
+    """Proveedor local sin red: busca por substring en una lista fija."""
+
+    name = 'fake'
+
+    DEFAULT_PLACES = (
+        {'label': 'Plaza de Armas, Santiago, Chile', 'latitude': -33.4378, 'longitude': -70.6505},
+        {'label': 'Catedral Metropolitana de Santiago, Chile', 'latitude': -33.4376, 'longitude': -70.6515},
+        {'label': 'Cerro San Cristóbal, Santiago, Chile', 'latitude': -33.4251, 'longitude': -70.6334},
+        {'label': 'Viña del Mar, Valparaíso, Chile', 'latitude': -33.0245, 'longitude': -71.5518},
+    )
+
+    def __init__(self, places=None):
+        self.places = list(places or self.DEFAULT_PLACES)
+        self.calls = 0
+
+    def search(self, query: str, limit: int) -> list:
+        self.calls += 1
+        needle = normalize_query(query)
+        matches = [p for p in self.places if needle in normalize_query(p['label'])]
+        return [dict(p) for p in matches[:limit]]
+
+
+# ---------- Cache ----------
+
+class GeocodeCache:
+    """LRU en memoria con TTL; los misses consultan SQLite antes que la red."""
+
+    def __init__(self, path: str = GEOCODE_CACHE_PATH, max_entries: int = GEOCODE_MEMORY_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        with self._db() as db:
+            db.execute(
+                'CREATE TABLE IF NOT EXISTS geocode_cache ('
+                ' key TEXT PRIMARY KEY, payload TEXT NOT NULL, expires_at REAL NOT NULL)'
+            )
+
+    def _db(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=5)
+
+    def get(self, key: str):
+        now = time.time()
+        with self._lock:
+            hit = self._memory.get(key)
+            if hit is not None:
+                expires_at, items = hit
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    return items
+                del self._memory[key]
+
+        try:
+            with self._db() as db:
+                row = db.execute(
+                    'SELECT payload, expires_at FROM geocode_cache WHERE key = ?',
+                    (key,),
+                ).fetchone()
+        except sqlite3.Error as e:
+            print('Error leyendo cache de geocoding:', e)
+            return None
+        if not row or row[1] <= now:
+            return None
+
+        items = json.loads(row[0])
+        self._remember(key, row[1], items)
+        return items
+
+    def set(self, key: str, items: list, ttl: float) -> None:
+        expires_at = time.time() + ttl
+        self._remember(key, expires_at, items)
+        try:
+            with self._db() as db:
+                db.execute(
+                    'INSERT OR REPLACE INTO geocode_cache (key, payload, expires_at) VALUES (?, ?, ?)',
+                    (key, json.dumps(items), expires_at),
+                )
+        except sqlite3.Error as e:
+            print('Error guardando cache de geocoding:', e)
+
+    def _remember(self, key: str, expires_at: float, items: list) -> None:
+        with self._lock:
+            self._memory[key] = (expires_at, items)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+
+# ---------- Concurrencia ----------
+
+class SingleFlight:
+    """Coalesce llamadas con la misma llave: solo la primera ejecuta `fn`."""
+
+    class _Call:
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: str, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = self._Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+
+class TokenBucket:
+    """
+    Token bucket compartido entre procesos vía una fila en SQLite.
+
+    `rate` tokens por segundo, hasta `capacity` acumulados.
+    """
+
+    def __init__(self, name: str, rate: float, capacity: float = 1.0, path: str = GEOCODE_CACHE_PATH):
+        self.name = name
+        self.rate = rate
+        self.capacity = capacity
+        self.path = path
+        with self._db() as db:
+            db.execute(
+                'CREATE TABLE IF NOT EXISTS token_buckets ('
+                ' name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)'
+            )
+            db.execute(
+                'INSERT OR IGNORE INTO token_buckets (name, tokens, updated_at) VALUES (?, ?, ?)',
+                (name, capacity, time.time()),
+            )
+
+    def _db(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=5, isolation_level=None)
+
+    def _try_take(self) -> float:
+        """Toma un token; devuelve 0 si lo logró o los segundos a esperar."""
+        db = self._db()
+        try:
+            db.execute('BEGIN IMMEDIATE')
+            tokens, updated_at = db.execute(
+                'SELECT tokens, updated_at FROM token_buckets WHERE name = ?',
+                (self.name,),
+            ).fetchone()
+            now = time.time()
+            tokens = min(self.capacity, tokens + max(0.0, now - updated_at) * self.rate)
+            wait = 0.0
+            if tokens >= 1.0:
+                tokens -= 1.0
+            else:
+                wait = (1.0 - tokens) / self.rate
+            db.execute(
+                'UPDATE token_buckets SET tokens = ?, updated_at = ? WHERE name = ?',
+                (tokens, now, self.name),
+            )
+            db.execute('COMMIT')
+            return wait
+        except Exception:
+            db.execute('ROLLBACK')
+            raise
+        finally:
+            db.close()
+
+    def acquire(self, timeout: float) -> None:
+        deadline = time.monotonic() + timeout
+        while True:
+            wait = self._try_take()
+            if wait <= 0:
+                return
+            if time.monotonic() + wait > deadline:
+                raise GeocodingRateLimited('Demasiadas búsquedas, intenta de nuevo en un momento')
+            time.sleep(wait)
+
+
+# ---------- Gateway ----------
+
+class GeocodingGateway:
+    """cache -> single-flight -> rate limit -> proveedor"""
+
+    def __init__(self, provider: GeocodingProvider, cache: GeocodeCache = None,
+                 limiter: TokenBucket = None, max_wait_seconds: float = 5.0):
+        self.provider = provider
+        self.cache = cache
+        self.limiter = limiter
+        self.max_wait_seconds = max_wait_seconds
+        self._flight = SingleFlight()
+
+    def search(self, query: str, limit: int) -> list:
+        normalized = normalize_query(query)
+        if not normalized:
+            return []
+        key = f'{self.provider.name}:{normalized}'
+
+        cached = self.cache.get(key) if self.cache else None
+        if cached is None:
+            cached = self._flight.do(key, lambda: self._fetch(key, normalized))
+        return cached[:limit]
+
+    def _fetch(self, key: str, normalized: str) -> list:
+        # Otro request pudo llenar la cache mientras esperábamos el turno.
+        cached = self.cache.get(key) if self.cache else None
+        if cached is not None:
+            return cached
+
+        if self.limiter:
+            self.limiter.acquire(self.max_wait_seconds)
+        items = self.provider.search(normalized, MAX_RESULTS)
+
+        if self.cache:
+            ttl = GEOCODE_CACHE_TTL_SECONDS if items else GEOCODE_NEGATIVE_TTL_SECONDS
+            self.cache.set(key, items, ttl)
+        return items
+
+
+def build_geocoding_gateway() -> GeocodingGateway:
+    """Gateway según GEOCODING_PROVIDER (nominatim por defecto, o fake)."""
+    provider_name = (os.environ.get('GEOCODING_PROVIDER') or 'nominatim').strip().lower()
+    if provider_name == 'fake':
+        provider, path = FakeGeocodingProvider(), FAKE_GEOCODE_CACHE_PATH
+    else:
+        provider, path = NominatimProvider(), GEOCODE_CACHE_PATH
+
+    return GeocodingGateway(
+        provider,
+        cache=GeocodeCache(path),
+        limiter=TokenBucket(provider.name, rate=NOMINATIM_RATE_PER_SECOND, path=path),
+    )
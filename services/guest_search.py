@@ -0,0 +1,211 @@
+"""
+Búsqueda de invitados por nombre
+================================
+
+Índice en memoria por evento sobre events/{eventId}/guests:
+- Nombres plegados (sin tildes, minúsculas): "jose" encuentra "José".
+- Trigramas para términos de 3+ letras y prefijo de palabra (bisect sobre
+  la lista ordenada de palabras) para términos cortos.
+- Se mantiene al día con un listener on_snapshot por evento: solo se
+  aplican los cambios, nunca se relee la lista completa.
+"""
+
+import bisect
+import heapq
+import re
+import threading
+import unicodedata
+from collections import OrderedDict, defaultdict
+
+MAX_INDEXED_EVENTS = 64
+INITIAL_LOAD_TIMEOUT_SECONDS = 10
+
+_NON_ALNUM = re.compile(r'[^0-9a-z]+')
+
+
+def fold(text: str) -> str:
+    """Minúsculas, sin tildes ni signos: 'María-José ' -> 'maria jose'."""
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    stripped = ''.join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return _NON_ALNUM.sub(' ', stripped.casefold()).strip()
+
+
+def _trigrams(text: str) -> set:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class GuestSearchIndex:
+    """Índice de un evento. Thread-safe; las búsquedas no tocan Firestore."""
+
+    def __init__(self):
+        self._guests = {}
+        self._postings = defaultdict(set)
+        self._words = []
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._guests)
+
+    def upsert(self, guest_id: str, data: dict) -> None:
+        name = (data.get('name') or '').strip()
+        table_number = data.get('tableNumber')
+        guest = {
+            'guestId': guest_id,
+            'name': name or 'Invitado',
+            'tableNumber': '' if table_number is None else str(table_number),
+            'status': data.get('status') or 'invited',
+            'arrivalAt': data.get('arrivalAt') or data.get('timestamp'),
+            'folded': fold(name),
+        }
+        with self._lock:
+            self._remove_locked(guest_id)
+            self._guests[guest_id] = guest
+            for gram in _trigrams(guest['folded']):
+                self._postings[gram].add(guest_id)
+            for word in set(guest['folded'].split()):
+                bisect.insort(self._words, (word, guest_id))
+
+    def remove(self, guest_id: str) -> None:
+        with self._lock:
+            self._remove_locked(guest_id)
+
+    def _remove_locked(self, guest_id: str) -> None:
+        guest = self._guests.pop(guest_id, None)
+        if guest is None:
+            return
+        for gram in _trigrams(guest['folded']):
+            ids = self._postings.get(gram)
+            if ids is not None:
+                ids.discard(guest_id)
+                if not ids:
+                    del self._postings[gram]
+        for word in set(guest['folded'].split()):
+            pos = bisect.bisect_left(self._words, (word, guest_id))
+            if pos < len(self._words) and self._words[pos] == (word, guest_id):
+                del self._words[pos]
+
+    def _candidates(self, term: str) -> set:
+        if len(term) >= 3:
+            grams = sorted(_trigrams(term), key=lambda g: len(self._postings.get(g, ())))
+            ids = set(self._postings.get(grams[0], ()))
+            for gram in grams[1:]:
+                ids &= self._postings.get(gram, set())
+                if not ids:
+                    break
+            # Los trigramas no garantizan orden: se confirma el substring.
+            return {gid for gid in ids if term in self._guests[gid]['folded']}
+
+        ids = set()
+        pos = bisect.bisect_left(self._words, (term, ''))
+        while pos < len(self._words) and self._words[pos][0].startswith(term):
+            ids.add(self._words[pos][1])
+            pos += 1
+        return ids
+
+    def search(self, query: str, limit: int = 10, status: str = None) -> list:
+        """
+        Top-`limit` invitados cuyo nombre contiene todos los términos.
+
+        Orden: nombre que empieza con la consulta, luego palabras que empiezan
+        con cada término, luego nombre más corto y alfabético.
+        """
+        folded_query = fold(query)
+        terms = folded_query.split()
+        with self._lock:
+            if terms:
+                ids = None
+                for term in sorted(terms, key=len, reverse=True):
+                    found = self._candidates(term)
+                    ids = found if ids is None else ids & found
+                    if not ids:
+                        return []
+            else:
+                ids = self._guests.keys()
+
+            def rank(gid):
+                folded = self._guests[gid]['folded']
+                words = folded.split()
+                word_hits = sum(1 for t in terms if any(w.startswith(t) for w in words))
+                return (
+                    0 if folded.startswith(folded_query) else 1,
+                    -word_hits,
+                    len(folded),
+                    folded,
+                )
+
+            matches = (gid for gid in ids if not status or self._guests[gid]['status'] == status)
+            best = heapq.nsmallest(limit, matches, key=rank)
+            return [
+                {k: v for k, v in self._guests[gid].items() if k != 'folded'}
+                for gid in best
+            ]
+
+
+class _EventWatch:
+    def __init__(self):
+        self.index = GuestSearchIndex()
+        self.ready = threading.Event()
+        self.watch = None
+
+
+class GuestSearchRegistry:
+    """Un índice (y un listener) por evento, creado al primer uso."""
+
+    def __init__(self, db, max_events: int = MAX_INDEXED_EVENTS):
+        self.db = db
+        self.max_events = max_events
+        self._events = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _guests_ref(self, event_id: str):
+        return self.db.collection('events').document(event_id).collection('guests')
+
+    def index(self, event_id: str) -> GuestSearchIndex:
+        with self._lock:
+            entry = self._events.get(event_id)
+            if entry is not None:
+                self._events.move_to_end(event_id)
+            else:
+                entry = self._events[event_id] = _EventWatch()
+                entry.watch = self._guests_ref(event_id).on_snapshot(
+                    lambda docs, changes, read_time: self._apply(entry, changes)
+                )
+                while len(self._events) > self.max_events:
+                    _, evicted = self._events.popitem(last=False)
+                    self._close(evicted)
+
+        if not entry.ready.wait(INITIAL_LOAD_TIMEOUT_SECONDS):
+            # Listener que nunca cargó: se descarta para que el próximo
+            # request lo vuelva a abrir en vez de esperar uno muerto.
+            with self._lock:
+                owned = self._events.get(event_id) is entry
+                if owned:
+                    del self._events[event_id]
+            if owned:
+                self._close(entry)
+            raise TimeoutError('El índice de invitados aún no está listo')
+        return entry.index
+
+    def search(self, event_id: str, query: str, limit: int = 10, status: str = None) -> list:
+        return self.index(event_id).search(query, limit=limit, status=status)
+
+    def _apply(self, entry: _EventWatch, changes) -> None:
+        try:
+            for change in changes:
+                doc = change.document
+                if change.type.name == 'REMOVED':
+                    entry.index.remove(doc.id)
+                else:
+                    entry.index.upsert(doc.id, doc.to_dict() or {})
+        except Exception as e:
+            print('Error actualizando índice de invitados:', e)
+        finally:
+            entry.ready.set()
+
+    @staticmethod
+    def _close(entry: _EventWatch) -> None:
+        try:
+            if entry.watch is not None:
+                entry.watch.unsubscribe()
+        except Exception as e:
+            print('Error cerrando listener de invitados:', e)
@@ -0,0 +1,154 @@
+"""
+Variantes de imagen de la galería
+=================================
+
+Genera miniatura, tamaño medio y tamaño completo de cada foto subida:
+- Aplica la rotación EXIF y descarta los metadatos (ubicación, cámara).
+- WebP cuando Pillow lo soporta, JPEG si no.
+- El decode/resize corre en un pool de procesos para no bloquear el GIL
+  de los workers de Flask; la subida de resultados corre en hilos.
+"""
+
+import io
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from PIL import Image, ImageOps, features
+
+# (nombre, lado mayor en px), de mayor a menor: cada una se escala desde la anterior.
+VARIANT_SIZES = (
+    ('full', 2048),
+    ('medium', 1080),
+    ('thumb', 320),
+)
+
+WEBP_QUALITY = 80
+JPEG_QUALITY = 82
+
+# Tope de píxeles a decodificar (~40 MP). Un PNG enorme no tiene draft()
+# y se decodifica completo: sobre esto se rechaza antes de tocar la memoria.
+MAX_IMAGE_PIXELS = 40_000_000
+
+# Fotos esperando variantes; cada una retiene sus bytes (hasta 10 MB).
+IMAGE_MAX_PENDING = int(os.environ.get('IMAGE_MAX_PENDING', '8'))
+
+
+def render_variants(data: bytes) -> list:
+    """
+    Decodifica `data` y devuelve las variantes codificadas.
+
+    Se ejecuta en un proceso aparte; recibe y devuelve solo tipos simples.
+
+    Returns:
+        Lista de dicts { name, data, contentType, ext, width, height }
+    """
+    use_webp = features.check('webp')
+    Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+
+    with Image.open(io.BytesIO(data)) as img:
+        if img.width * img.height > MAX_IMAGE_PIXELS:
+            raise ValueError(f'Imagen demasiado grande ({img.width}x{img.height})')
+
+        # En JPEG decodifica directo a escala reducida si la foto es enorme.
+        largest = VARIANT_SIZES[0][1]
+        img.draft('RGB', (largest, largest))
+        current = ImageOps.exif_transpose(img)
+
+        has_alpha = current.mode in ('RGBA', 'LA') or 'transparency' in current.info
+        if use_webp and has_alpha:
+            current = current.convert('RGBA')
+        else:
+            current = current.convert('RGB')
+
+        variants = []
+        for name, max_side in VARIANT_SIZES:
+            current = current.copy()
+            current.thumbnail((max_side, max_side), Image.LANCZOS, reducing_gap=3.0)
+
+            out = io.BytesIO()
+            if use_webp:
+                current.save(out, format='WEBP', quality=WEBP_QUALITY, method=4)
+                content_type, ext = 'image/webp', '.webp'
+            else:
+                current.save(out, format='JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+                content_type, ext = 'image/jpeg', '.jpg'
+
+            variants.append({
+                'name': name,
+                'data': out.getvalue(),
+                'contentType': content_type,
+                'ext': ext,
+                'width': current.width,
+                'height': current.height,
+            })
+
+    return variants
+
+
+class ImageVariantPipeline:
+    """Render en procesos + callback de subida en hilos, ambos acotados."""
+
+    def __init__(self, max_processes: int = None, max_threads: int = 2, max_pending: int = None):
+        self.max_processes = max_processes or int(os.environ.get('IMAGE_WORKERS', '1'))
+        self._threads = ThreadPoolExecutor(
+            max_workers=max_threads,
+            thread_name_prefix='gallery-variants',
+        )
+        self._pending = threading.BoundedSemaphore(max_pending or IMAGE_MAX_PENDING)
+        self._processes = None
+        self._lock = threading.Lock()
+
+    def _process_pool(self) -> ProcessPoolExecutor:
+        # Perezoso: el pool se crea dentro del worker de gunicorn, no en el master.
+        # forkserver: hacer fork de un worker con hilos gRPC de Firestore vivos
+        # no es seguro; los hijos parten de un proceso limpio.
+        with self._lock:
+            if self._processes is None:
+                context = multiprocessing.get_context('forkserver')
+                context.set_forkserver_preload([__name__])
+                self._processes = ProcessPoolExecutor(
+                    max_workers=self.max_processes,
+                    mp_context=context,
+                )
+            return self._processes
+
+    def _discard_pool(self, pool: ProcessPoolExecutor) -> None:
+        """Descarta un pool roto (hijo muerto por OOM/kill) para crear otro."""
+        with self._lock:
+            if self._processes is pool:
+                self._processes = None
+        pool.shutdown(wait=False)
+
+    def submit(self, data: bytes, on_ready) -> bool:
+        """
+        Genera las variantes de `data` y llama on_ready(variants) en un hilo.
+
+        Returns:
+            False si la cola está llena: la foto queda sin variantes.
+        """
+        if not self._pending.acquire(blocking=False):
+            print('Cola de variantes llena: se omiten las variantes de la foto')
+            return False
+        try:
+            self._threads.submit(self._run, data, on_ready)
+        except Exception:
+            self._pending.release()
+            raise
+        return True
+
+    def _run(self, data: bytes, on_ready) -> None:
+        try:
+            pool = self._process_pool()
+            try:
+                variants = pool.submit(render_variants, data).result()
+            except BrokenProcessPool:
+                self._discard_pool(pool)
+                raise
+            on_ready(variants)
+        except Exception as e:
+            print('Error generando variantes de imagen:', e)
+        finally:
+            self._pending.release()
@@ -0,0 +1,239 @@
+"""
+Subidas reanudables por chunks
+==============================
+
+Sesiones de subida en disco local para videos grandes en redes malas:
+- init crea la sesión con el tamaño total declarado.
+- Cada PUT agrega bytes en un offset; si no coincide con lo recibido se
+  responde el offset real y el cliente retoma desde ahí.
+- Completa la sesión, el archivo se entrega a FirebaseService.upload_fileobj.
+
+Los metadatos van en un JSON junto al archivo parcial, así cualquier
+worker de gunicorn del mismo servidor atiende cualquier chunk.
+
+Finalize es idempotente: bajo el lock de la sesión se marca
+state=finalizing (con jobId si es asíncrono) y al terminar state=done con
+la respuesta, que se repite en cada finalize posterior. El archivo se borra
+pero los metadatos quedan hasta que la sesión expira.
+"""
+
+import fcntl
+import json
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from contextlib import contextmanager
+
+from services.uploads import UploadTooLarge
+
+UPLOAD_SESSIONS_DIR = os.environ.get(
+    'UPLOAD_SESSIONS_DIR',
+    os.path.join(tempfile.gettempdir(), 'gallery-uploads'),
+)
+
+# Sesiones sin actividad por más de esto se borran.
+SESSION_TTL_SECONDS = 24 * 60 * 60
+
+# Tamaño recomendado al cliente para cada PUT.
+RECOMMENDED_CHUNK_BYTES = 2 * 1024 * 1024
+
+# Un finalize que no terminó en este tiempo (proceso caído) se puede reintentar.
+FINALIZE_STALE_SECONDS = 15 * 60
+
+_READ_BUFFER = 64 * 1024
+
+
+class UploadSessionNotFound(Exception):
+    """La sesión no existe o expiró."""
+
+
+class OffsetMismatch(Exception):
+    """El offset del chunk no coincide con los bytes ya recibidos."""
+
+    def __init__(self, offset: int):
+        self.offset = offset
+        super().__init__(f'Offset inválido, continuar desde {offset}')
+
+
+class UploadIncomplete(Exception):
+    """Finalize antes de recibir todos los bytes."""
+
+    def __init__(self, offset: int):
+        self.offset = offset
+        super().__init__('Subida incompleta')
+
+
+class ResumableUploadStore:
+    """Sesiones de subida reanudable guardadas en `base_dir`."""
+
+    def __init__(self, base_dir: str = UPLOAD_SESSIONS_DIR):
+        self.base_dir = base_dir
+        os.makedirs(self.base_dir, exist_ok=True)
+
+    def _dir(self, upload_id: str) -> str:
+        if not upload_id or not upload_id.isalnum():
+            raise UploadSessionNotFound('uploadId inválido')
+        return os.path.join(self.base_dir, upload_id)
+
+    def data_path(self, upload_id: str) -> str:
+        return os.path.join(self._dir(upload_id), 'data')
+
+    @contextmanager
+    def _locked(self, upload_id: str):
+        session_dir = self._dir(upload_id)
+        if not os.path.isdir(session_dir):
+            raise UploadSessionNotFound('Sesión de subida no encontrada')
+        with open(os.path.join(session_dir, 'lock'), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield session_dir
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def create(self, meta: dict) -> str:
+        self.purge_stale()
+        upload_id = uuid.uuid4().hex
+        session_dir = self._dir(upload_id)
+        os.makedirs(session_dir)
+        with open(os.path.join(session_dir, 'meta.json'), 'w') as fh:
+            json.dump(meta, fh)
+        open(os.path.join(session_dir, 'data'), 'wb').close()
+        return upload_id
+
+    def get(self, upload_id: str) -> dict:
+        """Metadatos de la sesión más `offset` (bytes recibidos)."""
+        session_dir = self._dir(upload_id)
+        try:
+            with open(os.path.join(session_dir, 'meta.json')) as fh:
+                meta = json.load(fh)
+            if meta.get('state') == 'done':
+                meta['offset'] = meta['size']
+            else:
+                meta['offset'] = os.path.getsize(os.path.join(session_dir, 'data'))
+        except FileNotFoundError as exc:
+            raise UploadSessionNotFound('Sesión de subida no encontrada') from exc
+        return meta
+
+    def _update_meta(self, session_dir: str, **fields) -> None:
+        """Reescribe meta.json (llamar con el lock tomado); None borra el campo."""
+        path = os.path.join(session_dir, 'meta.json')
+        with open(path) as fh:
+            meta = json.load(fh)
+        for key, value in fields.items():
+            if value is None:
+                meta.pop(key, None)
+            else:
+                meta[key] = value
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as fh:
+            json.dump(meta, fh)
+        os.replace(tmp_path, path)
+
+    def begin_finalize(self, upload_id: str):
+        """
+        Marca la sesión como finalizando si nadie más lo está haciendo.
+
+        Returns:
+            (meta, started): started es False si ya está finalizando o
+            terminada; meta trae state, jobId, result y resultStatus.
+
+        Raises:
+            UploadSessionNotFound
+            UploadIncomplete: si faltan bytes
+        """
+        with self._locked(upload_id) as session_dir:
+            meta = self.get(upload_id)
+            state = meta.get('state')
+            if state == 'done':
+                return meta, False
+            if state == 'finalizing' and time.time() - meta.get('finalizingAt', 0) < FINALIZE_STALE_SECONDS:
+                return meta, False
+            if meta['offset'] != meta['size']:
+                raise UploadIncomplete(meta['offset'])
+
+            meta['state'] = 'finalizing'
+            meta['finalizingAt'] = time.time()
+            meta.pop('jobId', None)
+            self._update_meta(session_dir, state='finalizing', finalizingAt=meta['finalizingAt'], jobId=None)
+            return meta, True
+
+    def set_job(self, upload_id: str, job_id: str) -> None:
+        with self._locked(upload_id) as session_dir:
+            if self.get(upload_id).get('state') == 'finalizing':
+                self._update_meta(session_dir, jobId=job_id)
+
+    def finish(self, upload_id: str, result: dict, status: int) -> None:
+        """Guarda la respuesta de finalize y borra el archivo."""
+        with self._locked(upload_id) as session_dir:
+            self._update_meta(
+                session_dir,
+                state='done',
+                result=result,
+                resultStatus=status,
+                photoId=result.get('photoId'),
+            )
+            try:
+                os.remove(os.path.join(session_dir, 'data'))
+            except FileNotFoundError:
+                pass
+
+    def release(self, upload_id: str) -> None:
+        """Finalize falló: la sesión vuelve a aceptar un finalize nuevo."""
+        try:
+            with self._locked(upload_id) as session_dir:
+                if self.get(upload_id).get('state') == 'finalizing':
+                    self._update_meta(session_dir, state=None, finalizingAt=None, jobId=None)
+        except UploadSessionNotFound:
+            pass
+
+    def append(self, upload_id: str, offset: int, stream) -> int:
+        """
+        Agrega el cuerpo de `stream` en `offset` y devuelve el nuevo offset.
+
+        Raises:
+            OffsetMismatch: si `offset` no es el fin de lo recibido
+            UploadTooLarge: si se pasa del tamaño declarado en init
+        """
+        with self._locked(upload_id):
+            meta = self.get(upload_id)
+            current = meta['offset']
+            if offset != current:
+                raise OffsetMismatch(current)
+
+            remaining = int(meta['size']) - current
+            with open(self.data_path(upload_id), 'ab') as fh:
+                while True:
+                    chunk = stream.read(_READ_BUFFER)
+                    if not chunk:
+                        break
+                    if len(chunk) > remaining:
+                        raise UploadTooLarge(int(meta['maxBytes']))
+                    fh.write(chunk)
+                    remaining -= len(chunk)
+                fh.flush()
+                return fh.tell()
+
+    def discard(self, upload_id: str) -> None:
+        shutil.rmtree(self._dir(upload_id), ignore_errors=True)
+
+    def purge_stale(self) -> None:
+        cutoff = time.time() - SESSION_TTL_SECONDS
+        try:
+            entries = os.listdir(self.base_dir)
+        except FileNotFoundError:
+            return
+        for name in entries:
+            path = os.path.join(self.base_dir, name)
+            try:
+                # Las sesiones terminadas ya no tienen data: cuenta meta.json.
+                touched = max(
+                    os.path.getmtime(os.path.join(path, f))
+                    for f in ('data', 'meta.json')
+                    if os.path.exists(os.path.join(path, f))
+                )
+                if touched < cutoff:
+                    shutil.rmtree(path, ignore_errors=True)
+            except (OSError, ValueError):
+                continue
@@ -0,0 +1,106 @@
+"""
+Server-Sent Events
+==================
+
+Helpers para responder text/event-stream desde Flask.
+
+Cada conexión ocupa un hilo del worker mientras está abierta, así que los
+streams se cortan a los STREAM_MAX_SECONDS: EventSource reconecta solo
+(tras `retry` ms) y el servidor no acumula conexiones colgadas. Con gunicorn
+conviene el worker gthread (--threads) para tener varias abiertas a la vez.
+
+Además hay un cupo de streams abiertos por proceso (SSE_MAX_STREAMS), menor
+que los hilos del worker: sin cupo la ruta responde 503 y el cliente sigue
+con polling, en vez de dejar al worker sin hilos para el resto de la API.
+"""
+
+import json
+import os
+import queue
+import threading
+import time
+
+HEARTBEAT_SECONDS = 15
+STREAM_MAX_SECONDS = int(os.environ.get('SSE_MAX_SECONDS', '300'))
+RECONNECT_MILLIS = 2000
+
+# Si un cliente lento acumula más de esto, se le corta y reconecta.
+SUBSCRIBER_QUEUE_SIZE = 256
+
+MAX_OPEN_STREAMS = int(os.environ.get('SSE_MAX_STREAMS', '12'))
+
+SSE_HEADERS = {
+    'Cache-Control': 'no-cache',
+    'X-Accel-Buffering': 'no',
+}
+
+
+class SubscriberOverflow(Exception):
+    """El cliente no alcanzó a leer los mensajes y se desconecta."""
+
+
+class StreamSlots:
+    """Cupo de streams SSE abiertos en el proceso (compartido por todas las rutas)."""
+
+    def __init__(self, limit: int):
+        self._slots = threading.BoundedSemaphore(limit)
+
+    def acquire(self) -> bool:
+        return self._slots.acquire(blocking=False)
+
+    def release(self) -> None:
+        self._slots.release()
+
+
+stream_slots = StreamSlots(MAX_OPEN_STREAMS)
+
+
+def sse_event(data, event: str = None, event_id: str = None) -> str:
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    if event:
+        lines.append(f'event: {event}')
+    payload = data if isinstance(data, str) else json.dumps(data, separators=(',', ':'))
+    lines.extend(f'data: {line}' for line in payload.split('\n'))
+    return '\n'.join(lines) + '\n\n'
+
+
+def offer(subscriber: queue.Queue, message) -> bool:
+    """Encola sin bloquear; devuelve False si la cola del cliente está llena."""
+    try:
+        subscriber.put_nowait(message)
+        return True
+    except queue.Full:
+        return False
+
+
+def stream_queue(subscriber: queue.Queue, initial=(), max_seconds: int = STREAM_MAX_SECONDS,
+                 skip=None):
+    """
+    Genera el cuerpo SSE: primero `initial`, luego lo que llegue a la cola.
+
+    La cola recibe tuplas (event, data) ya listas para sse_event, o una
+    excepción SubscriberOverflow para cerrar el stream. `skip(event, data)`
+    permite descartar mensajes de la cola (p.ej. ya enviados en `initial`).
+    """
+    yield f'retry: {RECONNECT_MILLIS}\n\n'
+    for event, data in initial:
+        yield sse_event(data, event=event)
+
+    deadline = time.monotonic() + max_seconds
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        try:
+            message = subscriber.get(timeout=min(HEARTBEAT_SECONDS, remaining))
+        except queue.Empty:
+            yield ': ping\n\n'
+            continue
+        if isinstance(message, SubscriberOverflow):
+            return
+        event, data = message
+        if skip is not None and skip(event, data):
+            continue
+        yield sse_event(data, event=event)
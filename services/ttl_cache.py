@@ -0,0 +1,57 @@
+"""
+Cache en memoria con TTL
+========================
+
+Cache simple por proceso para lecturas calientes de Firestore.
+Cada worker de gunicorn tiene la suya: invalidate() solo limpia la del
+proceso que escribió, y el TTL acota cuánto puede atrasarse el resto.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Diccionario acotado (LRU) cuyas entradas expiran a los `ttl` segundos."""
+
+    def __init__(self, ttl: float, max_entries: int = 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                return default
+            expires_at, value = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl: float = _MISSING) -> None:
+        """Guarda `value`; ttl=None lo deja sin expiración."""
+        ttl = self.ttl if ttl is _MISSING else ttl
+        expires_at = None if ttl is None else time.monotonic() + ttl
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def get_or_load(self, key, loader):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = loader()
+            self.set(key, value)
+        return value
+
+    def invalidate(self, key) -> None:
+        with self._lock:
+            self._data.pop(key, None)
@@ -0,0 +1,198 @@
+"""
+Cola de subidas en segundo plano
+================================
+
+Pool acotado de workers que suben a Storage y crean el doc de galería
+fuera del request. El estado de cada job vive en memoria (progreso fino)
+y se persiste en Firestore en cada cambio de estado, para que cualquier
+worker de gunicorn pueda responder la consulta de estado.
+
+Los bytes aceptados se copian a disco local al encolar (no quedan en
+memoria mientras esperan) y la cola tiene un tope de bytes pendientes.
+Si el proceso se reinicia, los jobs en curso se pierden: un job en
+queued/uploading más viejo que UPLOAD_JOB_STALE_SECONDS se informa como error.
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+JOBS_COLLECTION = 'gallery_upload_jobs'
+
+# Jobs terminados que se recuerdan en memoria antes de leer de Firestore.
+MAX_JOBS_IN_MEMORY = 500
+
+UPLOAD_SPOOL_DIR = os.environ.get(
+    'UPLOAD_SPOOL_DIR',
+    os.path.join(tempfile.gettempdir(), 'gallery-upload-spool'),
+)
+
+# Bytes de jobs en cola + en curso por proceso (en disco; al subir, las
+# fotos se leen completas para las variantes).
+MAX_PENDING_BYTES = int(os.environ.get('UPLOAD_MAX_PENDING_MB', '160')) * 1024 * 1024
+
+# Un job sin terminar tras esto se da por perdido (reinicio, deploy).
+STALE_JOB_SECONDS = int(os.environ.get('UPLOAD_JOB_STALE_SECONDS', str(15 * 60)))
+
+COPY_CHUNK_BYTES = 1024 * 1024
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class UploadQueueFull(Exception):
+    """No hay cupo en la cola de subidas."""
+
+
+class UploadJobQueue:
+    """Pool de subidas con cupo máximo de jobs y de bytes en curso + en espera."""
+
+    def __init__(self, db, max_workers: int = None, max_pending: int = None,
+                 max_pending_bytes: int = None, spool_dir: str = UPLOAD_SPOOL_DIR):
+        self.db = db
+        self.max_workers = max_workers or int(os.environ.get('UPLOAD_WORKERS', '2'))
+        self.max_pending = max_pending or int(os.environ.get('UPLOAD_MAX_PENDING', '16'))
+        self.max_pending_bytes = max_pending_bytes or MAX_PENDING_BYTES
+        self.spool_dir = spool_dir
+        self._pool = ThreadPoolExecutor(
+            max_workers=self.max_workers,
+            thread_name_prefix='gallery-upload',
+        )
+        self._slots = threading.BoundedSemaphore(self.max_workers + self.max_pending)
+        self._pending_bytes = 0
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(self.spool_dir, exist_ok=True)
+        self._purge_spool()
+
+    def submit(self, work, meta: dict, stream, size: int) -> str:
+        """
+        Copia `stream` a disco y encola `work(file_obj, report_progress)`;
+        su retorno (dict) queda como resultado. `stream` se puede cerrar
+        apenas retorna.
+
+        Raises:
+            UploadQueueFull: si no hay cupo (jobs o bytes)
+        """
+        if not self._slots.acquire(blocking=False):
+            raise UploadQueueFull('Cola de subidas llena, intenta de nuevo en unos segundos')
+        with self._lock:
+            if self._pending_bytes + size > self.max_pending_bytes:
+                self._slots.release()
+                raise UploadQueueFull('Cola de subidas llena, intenta de nuevo en unos segundos')
+            self._pending_bytes += size
+
+        job_id = uuid.uuid4().hex
+        path = os.path.join(self.spool_dir, job_id)
+        job = {
+            'jobId': job_id,
+            'status': 'queued',
+            'progress': 0.0,
+            'createdAt': _now_iso(),
+            **meta,
+        }
+        try:
+            stream.seek(0)
+            with open(path, 'wb') as fh:
+                shutil.copyfileobj(stream, fh, COPY_CHUNK_BYTES)
+            self._set(job_id, job, persist=True)
+            self._pool.submit(self._run, job_id, work, path, size)
+        except Exception:
+            self._release(path, size)
+            raise
+        return job_id
+
+    def get(self, job_id: str):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                return dict(job)
+        snap = self.db.collection(JOBS_COLLECTION).document(job_id).get()
+        return self._expire_if_stale(snap.to_dict()) if snap.exists else None
+
+    def _expire_if_stale(self, job: dict) -> dict:
+        """Un job de otro proceso que lleva demasiado sin terminar se perdió."""
+        if job.get('status') not in ('queued', 'uploading'):
+            return job
+        since = job.get('startedAt') or job.get('createdAt') or ''
+        try:
+            started = datetime.fromisoformat(since)
+        except ValueError:
+            return job
+        if (datetime.now(timezone.utc) - started).total_seconds() < STALE_JOB_SECONDS:
+            return job
+
+        job = {
+            **job,
+            'status': 'error',
+            'error': 'La subida se interrumpió, vuelve a intentarlo',
+            'finishedAt': _now_iso(),
+        }
+        try:
+            self.db.collection(JOBS_COLLECTION).document(job['jobId']).set(job)
+        except Exception as e:
+            print('Error guardando estado de subida:', e)
+        return job
+
+    def _run(self, job_id: str, work, path: str, size: int) -> None:
+        try:
+            self._update(job_id, persist=True, status='uploading', startedAt=_now_iso())
+            with open(path, 'rb') as fh:
+                result = work(fh, lambda progress: self._update(job_id, progress=round(progress, 3)))
+            self._update(
+                job_id,
+                persist=True,
+                status='done',
+                progress=1.0,
+                finishedAt=_now_iso(),
+                **(result or {}),
+            )
+        except Exception as e:
+            self._update(job_id, persist=True, status='error', error=str(e), finishedAt=_now_iso())
+        finally:
+            self._release(path, size)
+
+    def _release(self, path: str, size: int) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        with self._lock:
+            self._pending_bytes -= size
+        self._slots.release()
+
+    def _purge_spool(self) -> None:
+        """Borra archivos de jobs perdidos en un reinicio anterior."""
+        cutoff = time.time() - STALE_JOB_SECONDS
+        for name in os.listdir(self.spool_dir):
+            path = os.path.join(self.spool_dir, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                continue
+
+    def _update(self, job_id: str, persist: bool = False, **changes) -> None:
+        with self._lock:
+            job = dict(self._jobs.get(job_id) or {'jobId': job_id})
+            job.update(changes)
+        self._set(job_id, job, persist=persist)
+
+    def _set(self, job_id: str, job: dict, persist: bool = False) -> None:
+        with self._lock:
+            self._jobs[job_id] = job
+            self._jobs.move_to_end(job_id)
+            while len(self._jobs) > MAX_JOBS_IN_MEMORY:
+                self._jobs.popitem(last=False)
+        if persist:
+            try:
+                self.db.collection(JOBS_COLLECTION).document(job_id).set(job)
+            except Exception as e:
+                print('Error guardando estado de subida:', e)
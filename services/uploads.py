@@ -0,0 +1,180 @@
+"""
+Subida de archivos acotada
+==========================
+
+Parseo multipart para la galería sin archivos temporales:
+- Rechaza por Content-Length antes de leer el cuerpo, y corta la lectura
+  si el cuerpo completo (todas las partes) supera el tope aunque no venga
+  Content-Length (chunked).
+- Un solo archivo por request y pocas partes de formulario.
+- El archivo se acumula en memoria con un tope según su tipo y se corta
+  apenas lo supera, sin leer el resto.
+- El SHA-256 del archivo se calcula mientras llega (deduplicación).
+- El buffer resultante se entrega tal cual a FirebaseService.upload_fileobj.
+"""
+
+import hashlib
+import io
+
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.formparser import FormDataParser
+
+MB = 1024 * 1024
+
+IMAGE_TYPES = {'image/jpeg', 'image/jpg', 'image/png', 'image/webp'}
+VIDEO_TYPES = {'video/mp4', 'video/quicktime', 'video/webm'}
+
+MAX_IMAGE_BYTES = 10 * MB
+MAX_VIDEO_BYTES = 40 * MB
+
+# Margen para boundaries y campos de texto del multipart.
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+# file + eventId/userId/userName/visibility y algo de holgura.
+MAX_FORM_PARTS = 16
+
+
+class UploadTooLarge(Exception):
+    """El archivo supera el máximo permitido para su tipo."""
+
+    def __init__(self, limit_bytes: int):
+        self.limit_bytes = limit_bytes
+        super().__init__(f'Archivo demasiado grande. Máximo {limit_bytes // MB}MB')
+
+
+class InvalidMultipart(Exception):
+    """Multipart con más de un archivo o demasiadas partes."""
+
+
+def media_type_for(content_type: str) -> str:
+    return 'video' if content_type in VIDEO_TYPES else 'image'
+
+
+def max_bytes_for(content_type: str) -> int:
+    # Tipos desconocidos usan el tope mayor; la ruta valida el tipo después.
+    if content_type in IMAGE_TYPES:
+        return MAX_IMAGE_BYTES
+    return MAX_VIDEO_BYTES
+
+
+class CappedBuffer(io.BytesIO):
+    """BytesIO que lanza UploadTooLarge al superar `limit` bytes escritos."""
+
+    def __init__(self, limit: int):
+        super().__init__()
+        self.limit = limit
+        self.size = 0
+        self.sha256 = hashlib.sha256()
+
+    def write(self, data) -> int:
+        self.size += len(data)
+        if self.size > self.limit:
+            raise UploadTooLarge(self.limit)
+        self.sha256.update(data)
+        return super().write(data)
+
+
+class _BodyBudget:
+    """Envuelve el cuerpo del request y corta al leer más de `limit` bytes."""
+
+    def __init__(self, stream, limit: int):
+        self._stream = stream
+        self.limit = limit
+        self.consumed = 0
+
+    def read(self, size=-1):
+        data = self._stream.read(size)
+        self.consumed += len(data)
+        if self.consumed > self.limit:
+            raise UploadTooLarge(MAX_VIDEO_BYTES)
+        return data
+
+
+def _capped_stream_factory():
+    """Factory para FormDataParser que acepta una sola parte de archivo."""
+    opened = []
+
+    def factory(total_content_length, content_type, filename, content_length=None):
+        if opened:
+            raise InvalidMultipart('Solo se permite un archivo por subida')
+        limit = max_bytes_for((content_type or '').strip().lower())
+        if content_length is not None and content_length > limit:
+            raise UploadTooLarge(limit)
+        opened.append(CappedBuffer(limit))
+        return opened[-1]
+
+    return factory
+
+
+def parse_capped_multipart(req):
+    """
+    Parsea un multipart/form-data de `req` sin tocar disco.
+
+    Returns:
+        Tupla (form, files) igual que request.form / request.files
+
+    Raises:
+        UploadTooLarge: si Content-Length, el cuerpo leído o el archivo
+            superan el máximo
+        InvalidMultipart: si trae más de un archivo o demasiadas partes
+    """
+    max_body = MAX_VIDEO_BYTES + MULTIPART_OVERHEAD_BYTES
+    if req.content_length is not None and req.content_length > max_body:
+        raise UploadTooLarge(MAX_VIDEO_BYTES)
+
+    parser = FormDataParser(
+        stream_factory=_capped_stream_factory(),
+        max_form_memory_size=MULTIPART_OVERHEAD_BYTES,
+        max_content_length=max_body,
+        max_form_parts=MAX_FORM_PARTS,
+        silent=False,
+    )
+    try:
+        _, form, files = parser.parse(
+            _BodyBudget(req.stream, max_body),
+            req.mimetype,
+            req.content_length,
+            req.mimetype_params,
+        )
+    except RequestEntityTooLarge as exc:
+        # Werkzeug usa 413 también para "demasiadas partes".
+        raise InvalidMultipart('Formulario de subida inválido') from exc
+    return form, files
+
+
+def stream_size(stream) -> int:
+    stream.seek(0, io.SEEK_END)
+    size = stream.tell()
+    stream.seek(0)
+    return size
+
+
+def content_hash(stream) -> str:
+    """SHA-256 hex del archivo; usa el calculado al recibirlo si existe."""
+    digest = getattr(stream, 'sha256', None)
+    if digest is not None:
+        return digest.hexdigest()
+
+    digest = hashlib.sha256()
+    stream.seek(0)
+    for chunk in iter(lambda: stream.read(1024 * 1024), b''):
+        digest.update(chunk)
+    stream.seek(0)
+    return digest.hexdigest()
+
+
+class ProgressReader:
+    """Envuelve un stream y reporta la fracción leída a `callback`."""
+
+    def __init__(self, stream, total: int, callback):
+        self._stream = stream
+        self._total = max(1, total)
+        self._callback = callback
+
+    def read(self, size=-1):
+        data = self._stream.read(size)
+        self._callback(min(1.0, self._stream.tell() / self._total))
+        return data
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
@@ -0,0 +1,174 @@
+"""
+Previews de video de la galería
+===============================
+
+Con el ffmpeg local extrae de cada video subido:
+- Un poster JPEG (frame cercano al segundo 1).
+- Un clip corto, sin audio y de bajo bitrate, para reproducir en el feed.
+- Duración y dimensiones (ya rotadas) vía ffprobe.
+
+ffmpeg necesita un archivo seekable (el moov de MP4/MOV suele ir al final),
+así que el video se escribe a un directorio temporal al encolarlo: los
+trabajos pendientes esperan en disco, no en memoria.
+"""
+
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+FFMPEG_BIN = os.environ.get('FFMPEG_BIN', 'ffmpeg')
+FFPROBE_BIN = os.environ.get('FFPROBE_BIN', 'ffprobe')
+
+POSTER_WIDTH = 720
+PREVIEW_WIDTH = 480
+PREVIEW_SECONDS = 4
+PREVIEW_BITRATE = '400k'
+FFMPEG_TIMEOUT_SECONDS = 120
+
+# Videos esperando preview (en disco); sobre esto se omite el preview.
+VIDEO_MAX_PENDING = int(os.environ.get('VIDEO_MAX_PENDING', '4'))
+COPY_CHUNK_BYTES = 1024 * 1024
+
+
+def ffmpeg_available() -> bool:
+    return bool(shutil.which(FFMPEG_BIN) and shutil.which(FFPROBE_BIN))
+
+
+def _run(args: list) -> bytes:
+    result = subprocess.run(
+        args,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        timeout=FFMPEG_TIMEOUT_SECONDS,
+        check=False,
+    )
+    if result.returncode != 0:
+        detail = result.stderr.decode('utf-8', 'replace').strip().splitlines()[-1:] or ['']
+        raise RuntimeError(f'{os.path.basename(args[0])} falló: {detail[0]}')
+    return result.stdout
+
+
+def probe_video(path: str) -> dict:
+    """Duración (s) y dimensiones de visualización del primer stream de video."""
+    raw = _run([
+        FFPROBE_BIN, '-v', 'error',
+        '-select_streams', 'v:0',
+        '-show_entries', 'stream=width,height:stream_tags=rotate:stream_side_data=rotation:format=duration',
+        '-of', 'json',
+        path,
+    ])
+    payload = json.loads(raw.decode('utf-8') or '{}')
+    stream = (payload.get('streams') or [{}])[0]
+    width = int(stream.get('width') or 0)
+    height = int(stream.get('height') or 0)
+
+    rotation = (stream.get('tags') or {}).get('rotate')
+    for side_data in stream.get('side_data_list') or []:
+        if 'rotation' in side_data:
+            rotation = side_data['rotation']
+    try:
+        if abs(int(float(rotation or 0))) % 180 == 90:
+            width, height = height, width
+    except (TypeError, ValueError):
+        pass
+
+    try:
+        duration = round(float((payload.get('format') or {}).get('duration') or 0), 2)
+    except (TypeError, ValueError):
+        duration = 0.0
+
+    return {'durationSeconds': duration, 'width': width, 'height': height}
+
+
+def render_video_previews(source: str) -> dict:
+    """
+    Procesa el video en `source`; poster y clip se escriben en su mismo directorio.
+
+    Returns:
+        { durationSeconds, width, height, poster: bytes, preview: bytes }
+    """
+    work_dir = os.path.dirname(source)
+    poster = os.path.join(work_dir, 'poster.jpg')
+    preview = os.path.join(work_dir, 'preview.mp4')
+
+    info = probe_video(source)
+    seek = min(1.0, info['durationSeconds'] / 2) if info['durationSeconds'] else 0.0
+
+    _run([
+        FFMPEG_BIN, '-v', 'error', '-y',
+        '-ss', f'{seek:.2f}', '-i', source,
+        '-frames:v', '1',
+        '-vf', f"scale='min({POSTER_WIDTH},iw)':-2",
+        '-q:v', '4',
+        poster,
+    ])
+    _run([
+        FFMPEG_BIN, '-v', 'error', '-y',
+        '-i', source,
+        '-t', str(PREVIEW_SECONDS),
+        '-an',
+        '-vf', f"scale='min({PREVIEW_WIDTH},iw)':-2",
+        '-c:v', 'libx264', '-preset', 'veryfast',
+        '-b:v', PREVIEW_BITRATE, '-maxrate', PREVIEW_BITRATE, '-bufsize', '800k',
+        '-pix_fmt', 'yuv420p',
+        '-movflags', '+faststart',
+        preview,
+    ])
+
+    with open(poster, 'rb') as fh:
+        info['poster'] = fh.read()
+    with open(preview, 'rb') as fh:
+        info['preview'] = fh.read()
+    return info
+
+
+class VideoPreviewPipeline:
+    """Cola acotada de procesamiento de videos (ffmpeg corre como subproceso)."""
+
+    def __init__(self, max_workers: int = None, max_pending: int = None):
+        self.max_workers = max_workers or int(os.environ.get('VIDEO_WORKERS', '1'))
+        self._pool = ThreadPoolExecutor(
+            max_workers=self.max_workers,
+            thread_name_prefix='gallery-video',
+        )
+        self._pending = threading.BoundedSemaphore(max_pending or VIDEO_MAX_PENDING)
+
+    def submit(self, file_obj, file_ext: str, on_ready) -> bool:
+        """
+        Copia `file_obj` a disco, procesa el video y llama on_ready(result)
+        en el hilo del pool.
+
+        Returns:
+            False si se omitió (sin ffmpeg o con la cola llena).
+        """
+        if not ffmpeg_available():
+            print('ffmpeg no disponible: se omite el poster del video')
+            return False
+        if not self._pending.acquire(blocking=False):
+            print('Cola de videos llena: se omite el poster del video')
+            return False
+
+        work_dir = tempfile.mkdtemp(prefix='gallery-video-')
+        try:
+            source = os.path.join(work_dir, f'source{file_ext or ".mp4"}')
+            with open(source, 'wb') as fh:
+                shutil.copyfileobj(file_obj, fh, COPY_CHUNK_BYTES)
+            self._pool.submit(self._run, work_dir, source, on_ready)
+        except Exception:
+            shutil.rmtree(work_dir, ignore_errors=True)
+            self._pending.release()
+            raise
+        return True
+
+    def _run(self, work_dir: str, source: str, on_ready) -> None:
+        try:
+            on_ready(render_video_previews(source))
+        except Exception as e:
+            print('Error generando preview de video:', e)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+            self._pending.release()
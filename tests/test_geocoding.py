@@ -0,0 +1,208 @@
+import http.client
+import os
+import socket
+import tempfile
+import threading
+import time
+import unittest
+
+from services.geocoding import (
+    FakeGeocodingProvider,
+    GeocodeCache,
+    GeocodingGateway,
+    GeocodingRateLimited,
+    NominatimProvider,
+    TokenBucket,
+)
+
+
+class _SlowProvider(FakeGeocodingProvider):
+    def search(self, query, limit):
+        time.sleep(0.1)
+        return super().search(query, limit)
+
+
+class GeocodingGatewayTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'geocode.sqlite3')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _gateway(self, provider, rate=100.0, capacity=100.0):
+        return GeocodingGateway(
+            provider,
+            cache=GeocodeCache(self.path),
+            limiter=TokenBucket(provider.name, rate=rate, capacity=capacity, path=self.path),
+        )
+
+    def test_normalized_queries_share_cache_entry(self):
+        provider = FakeGeocodingProvider()
+        gateway = self._gateway(provider)
+
+        first = gateway.search('Plaza de Armas', 5)
+        second = gateway.search('  plaza   DE armas ', 5)
+
+        self.assertEqual(first, second)
+        self.assertEqual(first[0]['label'], 'Plaza de Armas, Santiago, Chile')
+        self.assertEqual(provider.calls, 1)
+
+    def test_cache_survives_process_memory(self):
+        provider = FakeGeocodingProvider()
+        self._gateway(provider).search('santiago', 5)
+
+        # Otro gateway (otro worker) sobre el mismo archivo no llama al proveedor.
+        self._gateway(provider).search('santiago', 5)
+        self.assertEqual(provider.calls, 1)
+
+    def test_limit_is_applied_after_cache(self):
+        provider = FakeGeocodingProvider()
+        gateway = self._gateway(provider)
+
+        self.assertEqual(len(gateway.search('chile', 1)), 1)
+        self.assertEqual(len(gateway.search('chile', 10)), 4)
+        self.assertEqual(provider.calls, 1)
+
+    def test_empty_results_are_cached(self):
+        provider = FakeGeocodingProvider()
+        gateway = self._gateway(provider)
+
+        self.assertEqual(gateway.search('no existe', 5), [])
+        self.assertEqual(gateway.search('no existe', 5), [])
+        self.assertEqual(provider.calls, 1)
+
+    def test_blank_query_skips_provider(self):
+        provider = FakeGeocodingProvider()
+        self.assertEqual(self._gateway(provider).search('   ', 5), [])
+        self.assertEqual(provider.calls, 0)
+
+    def test_concurrent_identical_queries_single_flight(self):
+        provider = _SlowProvider()
+        gateway = self._gateway(provider)
+        results = []
+
+        threads = [
+            threading.Thread(target=lambda: results.append(gateway.search('viña', 5)))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(results), 8)
+        self.assertTrue(all(r == results[0] for r in results))
+        self.assertEqual(provider.calls, 1)
+
+    def test_rate_limited_when_no_token_in_time(self):
+        provider = FakeGeocodingProvider()
+        gateway = self._gateway(provider, rate=0.1, capacity=1.0)
+        gateway.max_wait_seconds = 0.05
+
+        gateway.search('santiago', 5)
+        with self.assertRaises(GeocodingRateLimited):
+            gateway.search('viña', 5)
+        # Lo ya cacheado no necesita cupo.
+        gateway.search('santiago', 5)
+        self.assertEqual(provider.calls, 1)
+
+
+class TokenBucketTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'buckets.sqlite3')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_takes_up_to_capacity_then_waits(self):
+        bucket = TokenBucket('test', rate=1.0, capacity=2.0, path=self.path)
+
+        self.assertEqual(bucket._try_take(), 0)
+        self.assertEqual(bucket._try_take(), 0)
+        wait = bucket._try_take()
+        self.assertGreater(wait, 0.9)
+        self.assertLessEqual(wait, 1.0)
+
+    def test_refills_over_time(self):
+        bucket = TokenBucket('test', rate=20.0, capacity=1.0, path=self.path)
+
+        bucket.acquire(timeout=0)
+        start = time.monotonic()
+        bucket.acquire(timeout=1.0)
+        self.assertGreater(time.monotonic() - start, 0.02)
+
+    def test_acquire_raises_past_timeout(self):
+        bucket = TokenBucket('test', rate=0.5, capacity=1.0, path=self.path)
+
+        bucket.acquire(timeout=0)
+        with self.assertRaises(GeocodingRateLimited):
+            bucket.acquire(timeout=0.1)
+
+    def test_shared_between_instances(self):
+        first = TokenBucket('shared', rate=0.5, capacity=1.0, path=self.path)
+        second = TokenBucket('shared', rate=0.5, capacity=1.0, path=self.path)
+
+        self.assertEqual(first._try_take(), 0)
+        self.assertGreater(second._try_take(), 0)
+
+    def test_buckets_are_independent_by_name(self):
+        TokenBucket('a', rate=0.5, capacity=1.0, path=self.path).acquire(timeout=0)
+        TokenBucket('b', rate=0.5, capacity=1.0, path=self.path).acquire(timeout=0)
+
+
+class _Response:
+    status = 200
+
+    def read(self):
+        return b'[]'
+
+
+class _Connection:
+    def __init__(self, error=None):
+        self.error = error
+        self.closed = False
+
+    def request(self, method, path, headers=None):
+        if self.error is not None:
+            raise self.error
+
+    def getresponse(self):
+        return _Response()
+
+    def close(self):
+        self.closed = True
+
+
+class NominatimRetryTest(unittest.TestCase):
+    def _provider(self, *connections):
+        provider = NominatimProvider()
+        pending = list(connections)
+        provider._connection = lambda: pending.pop(0)
+        return provider
+
+    def test_retries_once_when_keepalive_was_closed(self):
+        stale = _Connection(http.client.RemoteDisconnected('closed'))
+        provider = self._provider(stale, _Connection())
+
+        self.assertEqual(provider.search('santiago', 5), [])
+        self.assertTrue(stale.closed)
+
+    def test_gives_up_after_second_disconnect(self):
+        provider = self._provider(
+            _Connection(http.client.BadStatusLine('')),
+            _Connection(http.client.RemoteDisconnected('closed')),
+        )
+        with self.assertRaises(http.client.BadStatusLine):
+            provider.search('santiago', 5)
+
+    def test_timeout_is_not_retried(self):
+        provider = self._provider(_Connection(socket.timeout('timed out')), _Connection())
+
+        with self.assertRaises(socket.timeout):
+            provider.search('santiago', 5)
+
+
+if __name__ == '__main__':
+    unittest.main()